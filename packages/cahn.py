@@ -1,6 +1,7 @@
 import numpy as np
 from packages.controller import SimulationPlane
-from tools.utils.general_utils import write_data
+from tools.utils import sim_utils
+from tools.utils.general_utils import write_data, open_data_stream, stream_data, close_data_stream
 
 class Cahn(SimulationPlane):
     """Class for simulating the Cahn Hilliard system
@@ -14,15 +15,31 @@ class Cahn(SimulationPlane):
     - k: the value of k
     - sig0: the inital value of sigma
     - noise: noise added to the array.
+    - solver: either 'explicit' (euler) or 'spectral' (semi-implicit fourier)
+    - dt_value: dt value, the dx value if none
+    - adaptive_dt: whether the full simulation controls dt with step doubling
+    - cadence: measure the free energy every cadence steps or 'log' for log spaced steps
+    - structure: whether the full simulation also measures the structure factor and domain length
     """
+    dt_tolerance = 1e-3
+    dt_growth = 1.5
+    log_points = 10
+
     def __init__(self, dimensions, timesteps, sim_type, dx_value,
-                    M, a_and_b, k, sig0, noise):
+                    M, a_and_b, k, sig0, noise, solver="explicit", dt_value=None, adaptive_dt=False, cadence=1, structure=False):
         """
         Sirs Constuctor
         """
         super().__init__(dimensions, timesteps)
-        dt_value = float(dx_value)
-        self.sim_type = sim_type
+        dt_value = float(dt_value) if dt_value != None else float(dx_value)
+        self.sim_type = self.check_choice("sim_type", sim_type, self.sim_types)
+        self.solver = solver
+        self.adaptive_dt = adaptive_dt == True
+        self.structure = structure == True
+        self.cadence = cadence if cadence == "log" else int(cadence) if cadence != None else 1
+        self.dx_value = float(dx_value)
+        self.dt_value = dt_value
+        self.M = float(M)
         self.uConstant = float(k) / (float(dx_value) ** 2)
         self.sigConstant = (float(M) * dt_value) / (float(dx_value) ** 2)
         self.a = self.b = float(a_and_b)
@@ -45,10 +62,38 @@ class Cahn(SimulationPlane):
     #override
     def create_cells(self):
         self.cells = np.random.normal(
-            loc=0, scale= self.noise, size=(self.dimensions, self.dimensions))
-        for i in range(self.dimensions):
-            for j in range(self.dimensions):
-                self.cells[i, j] = self.cells[i, j] + self.sig0
+            loc=0, scale= self.noise, size=(self.dimensions, self.dimensions)) + self.sig0
+        # buffers the chemical potential and next step are worked out in
+        self.new_cells = np.empty_like(self.cells)
+        self.mew = np.empty_like(self.cells)
+        self.laplacian = np.empty_like(self.cells)
+        self.scratch = np.empty_like(self.cells)
+        if self.solver == "spectral":
+            self.create_spectral()
+
+    def create_spectral(self):
+        """Caches the fourier space arrays of the spectral solver
+
+        The five point stencil becomes 2cos(kx) + 2cos(ky) - 4 in fourier space so the
+        spectral solver works on the same discrete equation as the explicit one
+        """
+        row_waves = 2 * np.cos(2 * np.pi * np.fft.fftfreq(self.dimensions))
+        col_waves = 2 * np.cos(2 * np.pi * np.fft.rfftfreq(self.dimensions))
+        self.stencil = row_waves[:, None] + col_waves[None, :] - 4
+        self.update_spectral()
+
+    def update_spectral(self):
+        """Works out the fourier space factors that depend on the timestep"""
+        self.explicit_factor = self.sigConstant * self.stencil
+        # the stiff fourth order term is taken at the new step
+        self.implicit_factor = 1 + self.sigConstant * self.uConstant * self.stencil ** 2
+
+    def set_dt(self, dt_value):
+        """Changes the timestep and the constants that depend on it"""
+        self.dt_value = dt_value
+        self.sigConstant = (self.M * dt_value) / (self.dx_value ** 2)
+        if self.solver == "spectral":
+            self.update_spectral()
 
     #override
     def create_figure(self):
@@ -59,11 +104,7 @@ class Cahn(SimulationPlane):
 
     #override
     def anim_func(self, i):
-        self.new_cells = np.copy(self.cells)
-        for i in range(self.dimensions):
-            for j in range(self.dimensions):
-                self.new_cells[i,j] = self.cahn_hilliard(i, j)
-        self.cells = np.copy(self.new_cells)
+        self.cahn_hilliard()
         self.im.set_array(self.cells)
         self.check_sim()
         yield self.im
@@ -71,52 +112,159 @@ class Cahn(SimulationPlane):
     def start_full_sim(self):
         self.create_cells()
         self.sim_data = []
+        measurements = self.create_measurements()
+        if self.structure:
+            self.create_structure()
+        time = 0
+        self.rejected_steps = 0
         for t in range(self.timesteps):
-            self.new_cells = np.copy(self.cells)
-            for i in range(self.dimensions):
-                for j in range(self.dimensions):
-                    self.new_cells[i, j] = self.cahn_hilliard(i, j)
-            self.cells = np.copy(self.new_cells)
-            self.sim_data.append("{}, {}".format(t, self.free_energy()))
+            if self.adaptive_dt:
+                time += self.adaptive_step()
+            else:
+                self.cahn_hilliard()
+                time += self.dt_value
+            if t in measurements:
+                self.sim_data.append("{}, {}, {}".format(t, self.free_energy(), time))
+                if self.structure:
+                    self.measure_structure(t, time)
             self.check_sim()
+        if self.structure:
+            close_data_stream(self.structure_file)
         self.finished_sim()
 
-    def cahn_hilliard(self, i, j):
-        mew_component = self.sigConstant * (
-            # u(i + 1, j; n)
-            self.calc_mew(self.i_index(i), j) + \
-                # u(i - 1, j; n)
-                self.calc_mew(self.d_index(i), j) + \
-                    # u(i, j + 1; n)
-                    self.calc_mew(i, self.i_index(j)) + \
-                        # u(i, j -1; n)
-                        self.calc_mew(i, self.d_index(j)) - \
-                            # 4u(i, j)
-                            4 * self.calc_mew(i, j))
-        new_sigma = self.new_cells[i, j] + mew_component
-
-        return new_sigma
-
-    def calc_mew(self, i, j):
-        mew_init = - self.a * self.new_cells[i, j] + self.b * (self.new_cells[i, j] ** 3)
-        mew_product = - self.uConstant * (
-            # sig(i + 1, j; n)
-            self.new_cells[self.i_index(i), j] + \
-                # sig(i - 1, j; n)
-                self.new_cells[self.d_index(i), j] + \
-                    # sig(i, j + 1; n)
-                    self.new_cells[i, self.i_index(j)] + \
-                        # sig(i, j - 1; n)
-                        self.new_cells[i, self.d_index(j)] - \
-                            # 4sig(i, j, n)
-                            4 * self.cells[i, j])
-        mew = mew_init + mew_product
-        return mew
+    def adaptive_step(self):
+        """Does a step with step doubling, returning the time it moved the field on by
+
+        A step of dt is compared with two steps of dt / 2. If they differ by more than
+        dt_tolerance anywhere, or the free energy goes up, the step is thrown away and
+        retried with a smaller dt. Otherwise the two half steps are kept and dt is grown
+        by at most dt_growth for the next step (the error of a step goes as dt squared),
+        unless a step had to be retried. The explicit solver never goes past stable_dt,
+        thrown away steps are counted in rejected_steps
+        """
+        if self.solver == "explicit" and self.dt_value > self.stable_dt():
+            self.set_dt(self.stable_dt())
+        start_cells = self.cells.copy()
+        start_energy = self.free_energy()
+        retried = False
+        while True:
+            dt_value = self.dt_value
+            self.cahn_hilliard()
+            full_step = self.cells.copy()
+            self.cells[...] = start_cells
+            self.set_dt(dt_value / 2)
+            self.cahn_hilliard()
+            self.cahn_hilliard()
+            error = np.max(np.abs(self.cells - full_step))
+            scale = 0.9 * np.sqrt(self.dt_tolerance / error) if error > 0 else self.dt_growth
+            energy = self.free_energy()
+            energy_rose = energy > start_energy + 1e-12 * abs(start_energy)
+            if error <= self.dt_tolerance and not energy_rose:
+                # holding dt after a retry stops it bouncing off the largest dt that works
+                next_dt = dt_value * min(1 if retried else self.dt_growth, scale)
+                self.set_dt(min(next_dt, self.stable_dt()) if self.solver == "explicit" else next_dt)
+                return dt_value
+            if error <= self.dt_tolerance:
+                scale = 0.5
+            retried = True
+            self.rejected_steps += 1
+            self.cells[...] = start_cells
+            self.set_dt(dt_value * max(0.2, scale))
+
+    def stable_dt(self):
+        """Works out the largest dt the explicit solver is stable for
+
+        The shortest wavelength has a five point laplacian of -8, so about the equilibrium
+        values (where the bulk term adds 2a) a step is stable while
+        M dt / dx^2 * 8 * (8 k / dx^2 + 2a) <= 2
+        """
+        return self.dx_value ** 2 / (4 * self.M * (8 * self.uConstant + 2 * self.a))
+
+    def cahn_hilliard(self):
+        """Does a single step of the whole field with the chosen solver"""
+        if self.solver == "spectral":
+            self.spectral_step()
+        else:
+            self.explicit_step()
+
+    def explicit_step(self):
+        """Does a single explicit euler step of the whole field
+
+        The chemical potential is worked out once for every cell then the field is
+        moved on by its laplacian into the second buffer and the buffers are swapped
+        """
+        # mew = - a * sig + b * sig^3 - k / dx^2 * laplacian(sig)
+        sim_utils.periodic_laplacian(self.cells, self.laplacian)
+        np.multiply(self.cells, self.cells, out=self.mew)
+        self.mew *= self.cells
+        self.mew *= self.b
+        np.multiply(self.cells, self.a, out=self.scratch)
+        self.mew -= self.scratch
+        np.multiply(self.laplacian, self.uConstant, out=self.scratch)
+        self.mew -= self.scratch
+        # sig(n + 1) = sig(n) + M * dt / dx^2 * laplacian(mew)
+        sim_utils.periodic_laplacian(self.mew, self.laplacian)
+        np.multiply(self.laplacian, self.sigConstant, out=self.new_cells)
+        self.new_cells += self.cells
+        self.cells, self.new_cells = self.new_cells, self.cells
+
+    def spectral_step(self):
+        """Does a single semi-implicit step of the whole field in fourier space
+
+        The cubic and linear bulk terms are taken at the current step and the gradient
+        term implicitly, so much larger steps stay stable than with the explicit solver
+        """
+        # bulk part of mew = - a * sig + b * sig^3
+        np.multiply(self.cells, self.cells, out=self.mew)
+        self.mew *= self.cells
+        self.mew *= self.b
+        np.multiply(self.cells, self.a, out=self.scratch)
+        self.mew -= self.scratch
+        cells_transform = np.fft.rfft2(self.cells)
+        cells_transform += self.explicit_factor * np.fft.rfft2(self.mew)
+        cells_transform /= self.implicit_factor
+        self.cells = np.fft.irfft2(cells_transform, s=self.cells.shape)
+
+    def create_measurements(self):
+        """Works out the steps the free energy is measured at from the cadence
+
+        A log cadence measures log_points steps per decade, the last step is always measured
+        """
+        if self.cadence == "log":
+            decades = np.log10(self.timesteps)
+            steps = np.unique(np.logspace(0, decades, int(self.log_points * decades) + 1).astype(int)) - 1
+        else:
+            steps = np.arange(0, self.timesteps, max(1, self.cadence))
+        return set(steps.tolist()) | {self.timesteps - 1}
+
+    def create_structure(self):
+        """Sets up the radial bins and the data file the structure factor is streamed to"""
+        self.radial_bins, self.radial_weights = sim_utils.create_radial_bins(self.dimensions)
+        self.wavenumbers = 2 * np.pi * np.arange(1, self.dimensions // 2 + 1) / (self.dimensions * self.dx_value)
+        sim_info = "Cahn Hilliard Structure Factor with {} Cells and {} Timesteps (S(k) for k = 2 pi n / {} with n = 1 to {})".format(
+            self.dimensions ** 2, self.timesteps, self.dimensions * self.dx_value, self.dimensions // 2)
+        sim_info += "\ntimesteps, time, length, structure"
+        self.structure_file = open_data_stream(("CahnStructure", self.dimensions, self.timesteps), sim_info)
+
+    def measure_structure(self, timestep, time):
+        """Streams the circularly averaged structure factor and the domain length
+        (2 pi over the mean wavenumber weighted by the structure factor) of the field
+        """
+        structure = sim_utils.structure_factor(self.cells, self.radial_bins, self.radial_weights)
+        weighted = np.sum(self.wavenumbers * structure)
+        length = 2 * np.pi * np.sum(structure) / weighted if weighted > 0 else 0
+        line = "{}, {}, {}, ".format(timestep, time, length) + ", ".join(str(value) for value in structure)
+        stream_data(self.structure_file, line)
 
     def free_energy(self):
-        energy = - (self.a / 2) * (sum(sum(self.cells)) ** 2) + \
-            (self.a / 4) * (sum(sum(self.cells)) ** 4) + (self.k / 2) * \
-                (sum(sum(sum(np.gradient(self.cells)))) ** 2)
+        """Works out the free energy of the field, the bulk term plus the gradient term
+        from periodic forward differences, summed over the cells
+        """
+        np.multiply(self.cells, self.cells, out=self.scratch)
+        bulk = np.sum(self.scratch * ((self.b / 4) * self.scratch - self.a / 2))
+        gradient = np.sum((np.roll(self.cells, -1, axis=0) - self.cells) ** 2) + \
+            np.sum((np.roll(self.cells, -1, axis=1) - self.cells) ** 2)
+        energy = (bulk + (self.k / 2) * gradient / self.dx_value ** 2) * self.dx_value ** 2
         return energy
 
     #override
@@ -130,8 +278,12 @@ class Cahn(SimulationPlane):
 
     #override
     def finished_sim(self):
-        table_heads = "timesteps, energy"
+        table_heads = "timesteps, energy, time"
         timestep_values = [i for i in range(self.timesteps)]
         file_data = ("Cahn", self.dimensions, self.timesteps)
-        sim_info = "{} Simulation with {} Cells and {} Timesteps\n{}".format("Cahn Hilliard", self.dimensions ** 2, self.timesteps, table_heads)
+        sim_info = "{} Simulation with {} Cells and {} Timesteps".format("Cahn Hilliard", self.dimensions ** 2, self.timesteps)
+        if self.adaptive_dt:
+            print ("Adaptive dt: {} Steps Rejected".format(self.rejected_steps))
+            sim_info += " (Adaptive dt, {} Steps Rejected)".format(self.rejected_steps)
+        sim_info += "\n" + table_heads
         write_data(self.sim_data, file_data, sim_info)
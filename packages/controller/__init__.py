@@ -1 +1,2 @@
 from packages.controller.simulationPlane import SimulationPlane
+from packages.controller.icingPlane import IcingPlane
@@ -0,0 +1,302 @@
+import multiprocessing
+import numpy as np
+from packages.controller.simulationPlane import SimulationPlane
+from tools.utils.general_utils import write_data
+from tools.utils import sim_utils
+
+class IcingPlane(SimulationPlane):
+    """ Base Class for the icing model simulations (glauber and kawasaki)
+    dimensions: x and y dimension of the cells
+    timesteps: number of timesteps for the simulation
+    sim_type: simulation mode either 'visual' or 'full'
+    tempurature: between 1 and 5
+    debug: checks the running totals against the cells on every measurement
+    workers: number of processes the full simulation tempuratures are shared between
+    temp_mode: how the full simulation tempuratures are run either 'independent', 'anneal' or 'tempering'
+    swap_interval: sweeps between replica swap attempts when tempering
+    """
+    equilibrium_window = 10
+    burn_in_limit = 99
+
+    def __init__(self, dimensions, timesteps, sim_type, tempurature, debug=False, workers=1, temp_mode="independent", swap_interval=10):
+        """
+        IcingPlane Constructor
+
+        Tempurature: The Unitary tempurature of the system
+        Sim_type: The sim_type for either a visual or full simulation
+        Debug: Whether the running totals are checked against a full recalculation
+        Workers: The number of processes used for the full simulation
+        Temp_mode: Independent runs, warm started annealing or replica exchange for the full simulation
+        Swap_interval: The number of sweeps between replica exchange attempts
+        """
+        super().__init__(dimensions, timesteps)
+        self.tempurature = tempurature
+        self.sim_type = self.check_choice("sim_type", sim_type, self.sim_types)
+        self.debug = debug == True
+        self.workers = int(workers) if workers != None else 1
+        self.temp_mode = temp_mode
+        self.swap_interval = int(swap_interval) if swap_interval != None else 10
+        self.burn_in = {}
+        self.field_cells = None
+
+    def create_cells(self):
+        """Re-implemented from base class
+        Creates cells for the simulation and the running totals
+        """
+        self.cells = np.random.choice([1, -1], size=(self.dimensions, self.dimensions))
+        self.reset_totals()
+
+    def reset_totals(self):
+        """Recalculates the running energy and magnetisation totals from the cells"""
+        self.total_energy, self.total_mag = self.calculate_totals()
+
+    def calculate_totals(self):
+        """Calculates the total energy and magnetisation from scratch"""
+        return sim_utils.calculate_total_energy(self.cells), np.sum(self.cells)
+
+    def get_cells(self):
+        """Returns the cells as an array of spins for plotting"""
+        return self.cells
+
+    def create_figure(self):
+        """ Reimplemented from base class
+        Creates base figure elements that are required for visual sim
+        """
+        super().create_figure()
+        self.axes.set_title("{} Simulation For {} Cells".format(self.get_name(), self.dimensions ** 2))
+        self.im = self.axes.imshow(self.get_cells(), interpolation="nearest", animated=True)
+        self.fig.colorbar(self.im)
+
+    def start_sim(self):
+        """Re-implemented from base class
+        Runs either the visual simulation with matplotlib or full without
+        """
+        if self.sim_type.lower() == "visual":
+            self.create_cells()
+            self.create_figure()
+            super().start_sim()
+        else:
+            self.tempurature = np.arange(1, 3, 0.1)
+            self.start_full_sim()
+
+    def start_full_sim(self):
+        """Runs the full simulation procedure"""
+        self.warning_message()
+        quantities = []
+        if self.temp_mode in ("anneal", "tempering") and self.workers > 1:
+            print("Runtime Warning: {} runs all tempuratures in a single process.".format(self.temp_mode.title()))
+        if self.temp_mode == "tempering":
+            quantities = self.run_tempering()
+        elif self.temp_mode == "anneal":
+            # cools from the hottest tempurature but saves in tempurature order
+            self.create_cells()
+            for temp in self.tempurature[::-1]:
+                quantities = self.run_tempurature(temp, warm_start=True) + quantities
+        elif self.workers > 1:
+            # every tempurature gets its own independent random number stream, drawn from
+            # the global one so seeded runs are reproducible
+            seeds = np.random.SeedSequence(np.random.randint(2 ** 32)).spawn(len(self.tempurature))
+            jobs = [(self, temp, seed.generate_state(4)) for temp, seed in zip(self.tempurature, seeds)]
+            with multiprocessing.Pool(self.workers) as pool:
+                # the workers run quietly so progress is reported here in tempurature order
+                for temp, temp_quantities in zip(self.tempurature, pool.imap(run_tempurature, jobs)):
+                    print("Completed Tempurature: {0:.1f}".format(temp))
+                    quantities.extend(temp_quantities)
+        else:
+            for temp in self.tempurature:
+                quantities.extend(self.run_tempurature(temp))
+        self.avg_qauntities = quantities
+        self.finished_sim()
+
+    def run_tempurature(self, temp, warm_start=False, verbose=True):
+        """Runs the sweeps for a single tempurature and returns the measured quantities
+
+        A warm start carries on from the current cells and replaces the fixed burn
+        in with sweeps until equilibrium is detected. Progress is only printed when verbose.
+        """
+        self.avg_qauntities = []
+        if verbose:
+            print ("Current Tempurature: {0:.1f}".format(temp))
+        if warm_start:
+            self.equilibrate(temp)
+            first_sweep = self.burn_in_limit + 1
+        else:
+            self.create_cells()
+            first_sweep = 0
+        for i in range(first_sweep, self.timesteps):
+            if verbose and i % 10 == 0:
+                print("Current Sweep: {} out of {}".format(int(i), int(self.timesteps)))
+            self.sweep(temp)
+            if i >= 99 and i % 10 == 0:
+                self.calculate_averages(temp)
+        return self.avg_qauntities
+
+    def run_tempering(self):
+        """Runs a replica of the cells at every tempurature at once, swapping the
+        replicas of neighbouring tempuratures every swap interval
+        """
+        temps = np.asarray(self.tempurature, dtype=float)
+        replicas = []
+        for temp in temps:
+            self.create_cells()
+            replicas.append(self.cells)
+        replicas = np.stack(replicas)
+        totals = []
+        for replica in replicas:
+            self.cells = replica
+            totals.append(self.calculate_totals())
+        self.energies = np.array([total[0] for total in totals])
+        self.mags = np.array([total[1] for total in totals])
+        self.swap_attempts = np.zeros(len(temps) - 1, dtype=int)
+        self.swap_accepts = np.zeros(len(temps) - 1, dtype=int)
+        records = [[] for temp in temps]
+        for i in range(self.timesteps):
+            if i % 10 == 0:
+                print("Current Sweep: {} out of {}".format(int(i), int(self.timesteps)))
+            self.stacked_sweep(replicas, temps)
+            if (i + 1) % self.swap_interval == 0:
+                # alternates between the even and odd pairs of tempuratures
+                self.swap_replicas(replicas, temps, (i + 1) // self.swap_interval % 2)
+            if i >= 99 and i % 10 == 0:
+                if self.debug:
+                    for replica in range(len(temps)):
+                        self.cells, self.total_energy, self.total_mag = replicas[replica], self.energies[replica], self.mags[replica]
+                        self.check_totals()
+                for replica, temp in enumerate(temps):
+                    records[replica].append("{},{},{}".format(str(temp), str(self.energies[replica]), str(abs(self.mags[replica]))))
+        self.finished_swaps(temps)
+        return [record for temp_records in records for record in temp_records]
+
+    def stacked_sweep(self, replicas, temps):
+        """Sweeps every replica at its own tempurature updating their totals
+
+        Can be re-implemented in sub classes that can sweep the whole stack at once
+        """
+        for replica in range(len(replicas)):
+            self.cells = replicas[replica]
+            self.total_energy, self.total_mag = self.energies[replica], self.mags[replica]
+            self.sweep(temps[replica])
+            self.energies[replica], self.mags[replica] = self.total_energy, self.total_mag
+
+    def swap_replicas(self, replicas, temps, offset):
+        """Attempts to swap the replicas of neighbouring tempuratures starting from the offset"""
+        lower = np.arange(offset, len(temps) - 1, 2)
+        upper = lower + 1
+        # the totals count every bond twice so are halved for the boltzmann factor
+        exponent = (1 / temps[lower] - 1 / temps[upper]) * (self.energies[lower] - self.energies[upper]) / 2
+        accepted = np.random.uniform(0, 1, size=len(lower)) < np.exp(np.minimum(exponent, 0))
+        self.swap_attempts[lower] += 1
+        self.swap_accepts[lower[accepted]] += 1
+        first = np.concatenate([lower[accepted], upper[accepted]])
+        second = np.concatenate([upper[accepted], lower[accepted]])
+        replicas[first] = replicas[second]
+        self.energies[first] = self.energies[second]
+        self.mags[first] = self.mags[second]
+
+    def equilibrate(self, temp):
+        """Sweeps until the energy and magnetisation have stopped drifting"""
+        energies = []
+        mags = []
+        while len(energies) < self.burn_in_limit:
+            self.sweep(temp)
+            energies.append(self.total_energy)
+            mags.append(abs(self.total_mag))
+            if sim_utils.check_equilibrium(energies, self.equilibrium_window) and \
+                sim_utils.check_equilibrium(mags, self.equilibrium_window):
+                break
+        print("Equilibrium Reached After {} Sweeps".format(len(energies)))
+        self.burn_in[temp] = len(energies)
+
+    def calculate_averages(self, tempurature):
+        """ Records the energy and magnetisation of the system from the running totals """
+        if self.debug:
+            self.check_totals()
+        self.avg_qauntities.append("{},{},{}".format(str(tempurature), str(self.total_energy), str(abs(self.total_mag))))
+
+    def check_totals(self):
+        """ Checks the running totals against a full recalculation from the cells """
+        energy, mag = self.calculate_totals()
+        if energy != self.total_energy or mag != self.total_mag:
+            raise RuntimeError(
+                "Debug Error: running totals (energy {}, mag {}) do not match the cells (energy {}, mag {})".format(
+                    self.total_energy, self.total_mag, energy, mag))
+
+    def anim_func(self, i):
+        """ Repimplemented from base class
+        Used for visual simulation of the icing model
+        """
+        self.sweep(self.tempurature)
+        self.im.set_array(self.get_cells())
+        self.check_sim()
+        yield self.im
+
+    def create_field(self):
+        """Creates the local field (sum of the neighbouring spins) of every cell"""
+        self.field = sim_utils.neighbour_sum(self.cells)
+        self.field_cells = self.cells
+
+    def prepare_field(self, temp):
+        """Gets the local field ready for a sweep of single flips, returning the acceptance
+        table of the tempurature
+
+        The field is kept up to date by every flip so each energy change is one lookup. It is
+        only rebuilt when the cells have been replaced (new cells or another replica) or
+        changed by a sweep that does not keep it up to date
+        """
+        if self.field_cells is not self.cells:
+            self.create_field()
+        return sim_utils.create_acceptance_table(float(temp))
+
+    def flip_cell(self, row, col):
+        """Flips a cell updating the local field of its neighbours and the running totals"""
+        state = self.cells[row, col]
+        # total energy counts every bond twice so changes by twice the flip energy
+        self.total_energy += 4 * state * self.field[row, col]
+        self.total_mag -= 2 * state
+        self.cells[row, col] = - state
+        down = row + 1 if row + 1 < self.dimensions else 0
+        right = col + 1 if col + 1 < self.dimensions else 0
+        self.field[row - 1, col] -= 2 * state
+        self.field[down, col] -= 2 * state
+        self.field[row, col - 1] -= 2 * state
+        self.field[row, right] -= 2 * state
+
+    def finished_sim(self):
+        """ Method for finishing the simulation """
+        sim_info = "{} Simulation of {} Cells and {} TimeSteps (Temp Mode: {}".format(
+            self.get_name(), self.dimensions ** 2, self.timesteps, self.temp_mode)
+        if self.temp_mode == "tempering":
+            sim_info += ", Swap Interval: {}".format(self.swap_interval)
+        if len(self.burn_in) > 0:
+            burn_in = " ".join("{0:.1f}={1}".format(temp, sweeps) for temp, sweeps in sorted(self.burn_in.items()))
+            sim_info += ", Burn-In Sweeps: {}".format(burn_in)
+        sim_info += ")\ntemp,avgEnergy,avgMag"
+        file_parameters = [self.get_name(), self.dimensions, self.timesteps]
+        write_data(self.avg_qauntities, file_parameters, sim_info)
+
+    def finished_swaps(self, temps):
+        """ Saves the swap acceptance statistics of a tempering simulation """
+        swap_data = []
+        for pair in range(len(temps) - 1):
+            acceptance = self.swap_accepts[pair] / self.swap_attempts[pair] if self.swap_attempts[pair] > 0 else 0
+            swap_data.append("{0:.1f},{1:.1f},{2},{3}".format(temps[pair], temps[pair + 1], self.swap_attempts[pair], acceptance))
+        sim_info = "{} Tempering Simulation of {} Cells and {} TimeSteps\ntempLow,tempHigh,attempts,acceptance".format(self.get_name(), self.dimensions ** 2, self.timesteps)
+        file_parameters = ["{}Swaps".format(self.get_name()), self.dimensions, self.timesteps]
+        write_data(swap_data, file_parameters, sim_info)
+
+    @classmethod
+    def get_name(cls):
+        return str(cls.__name__).title()
+
+    def sweep(self, temp):
+        """ Base Method Needs To Be Re-implemented in sub classes
+        Used to do a single sweep of the cells updating the running totals
+        """
+        raise NotImplementedError(
+            "sweep function not reimplemented from base class")
+
+def run_tempurature(job):
+    """Runs a single tempurature of a full simulation inside a worker process"""
+    sim, temp, seed = job
+    np.random.seed(seed)
+    return sim.run_tempurature(temp, verbose=False)
@@ -10,6 +10,8 @@ class SimulationPlane(object):
     timesteps: number of timesteps for the simulation
     """
     index = 0
+    sim_types = ("visual", "full")
+    algorithms = ("random",)
     def __init__(self, dimensions, timesteps):
         """
         SimulationPlane Constuctor
@@ -20,6 +22,15 @@ class SimulationPlane(object):
         self.dimensions = int(dimensions)
         self.timesteps = int(timesteps)
 
+    def check_choice(self, parameter, value, choices):
+        """Checks a parameter shared between simulations (such as the sim type or sweep
+        algorithm) has a value this simulation supports
+        """
+        if value not in choices:
+            raise ValueError("Template Error: {} '{}' not supported for {}, use one of {}".format(
+                parameter, value, type(self).__name__, ", ".join(choices)))
+        return value
+
     def create_figure(self):
         """ Creates the figure elements for the simulations """
         plt.rcParams.update(general_utils.returnGraphConfigs("anim"))
@@ -74,11 +85,11 @@ class SimulationPlane(object):
 
     def d_index(self, coord):
         """Decrease index number in array in up or right directions"""
-        return coord - 1 if coord - 1 < 0 else self.dimensions - 1
+        return coord - 1 if coord - 1 >= 0 else self.dimensions - 1
 
     def i_index(self, coord):
         """Increase index number in array in down or left directions"""
-        return coord + 1 if coord + 1 > self.dimensions - 1 else 0
+        return coord + 1 if coord + 1 <= self.dimensions - 1 else 0
 
     def end_simulation(self):
         time.sleep(1)
@@ -1,9 +1,8 @@
 import numpy as np
-from packages.controller import SimulationPlane
-from tools.utils.general_utils import write_data
+from packages.controller import IcingPlane
 from tools.utils import sim_utils
 
-class Glauber(SimulationPlane):
+class Glauber(IcingPlane):
     """ Class for simulating Glauber dynamics in Icing Model
 
     dimensions: x and y dimension of the cells
@@ -13,98 +12,107 @@ class Glauber(SimulationPlane):
     tempurature: between 1 and 5
 
     sim_type: simulation mode either 'visual' or 'full'
+
+    algorithm: sweep algorithm either 'random', 'checkerboard', 'wolff', 'swendsen' or 'multispin'
+
+    debug: checks the running energy and magnetisation totals when measuring
+
+    workers: number of processes used for the full simulation
+
+    temp_mode: full simulation tempuratures either 'independent', 'anneal' or 'tempering'
+
+    swap_interval: sweeps between replica swaps when tempering
     """
-    def __init__(self, dimensions, timesteps, sim_type, tempurature):
+    algorithms = ("random", "checkerboard", "wolff", "swendsen", "multispin")
+
+    def __init__(self, dimensions, timesteps, sim_type, tempurature, algorithm="random", debug=False, workers=1, temp_mode="independent", swap_interval=10):
         """
         Glauber Constructor
 
         Tempurature: The Unitary tempurature of the system
         Mode: The sim_type for either a visual or full simulation
+        Algorithm: Random site picking, vectorised checkerboard sweeps, cluster updates or bit packed spins
         """
-        super().__init__(dimensions, timesteps)
-        self.tempurature = tempurature
-        self.sim_type = sim_type
+        super().__init__(dimensions, timesteps, sim_type, tempurature, debug, workers, temp_mode, swap_interval)
+        self.algorithm = self.check_choice("algorithm", algorithm, self.algorithms)
 
     def create_cells(self):
         """Re-implemented from base class
         Creates cells for the simulation
         """
-        self.cells = np.random.choice([1, -1], size=(self.dimensions, self.dimensions))
+        if self.algorithm == "multispin" and self.dimensions % 64 != 0:
+            print("Runtime Warning: multispin needs dimensions that are a multiple of 64, using checkerboard instead.")
+            self.algorithm = "checkerboard"
+        if self.algorithm == "multispin":
+            # 64 spins are packed into the bits of each word, a set bit being spin up
+            self.cells = sim_utils.random_packed((self.dimensions, self.dimensions // 64), 0.5)
+            self.reset_totals()
+        else:
+            super().create_cells()
+        if self.algorithm == "checkerboard":
+            self.sublattices = sim_utils.create_sublattices(self.dimensions)
+        elif self.algorithm == "swendsen":
+            self.bonds = sim_utils.create_bonds(self.dimensions)
 
-    def create_figure(self):
-        """ Reimplemented from base class
-        Creates base figure elements that are required for visual sim
+    def calculate_totals(self):
+        """Re-implemented from base class
+        Calculates the total energy and magnetisation from scratch
         """
-        super().create_figure()
-        self.axes.set_title("Glauber Simulation For {} Cells".format(self.dimensions ** 2))
-        self.im = self.axes.imshow(self.cells, interpolation="nearest", animated=True)
-        self.fig.colorbar(self.im)
+        if self.algorithm == "multispin":
+            return sim_utils.calculate_packed_totals(self.cells)
+        return super().calculate_totals()
 
-    def start_sim(self):
+    def get_cells(self):
         """Re-implemented from base class
-        Starts the full simulation or visual simulation
+        Unpacks the spins of the multispin algorithm for plotting
         """
-        if self.sim_type.lower() == "visual":
-            self.create_cells()
-            self.create_figure()
-            super().start_sim()
-        else:
-            self.tempurature = np.arange(1, 3, 0.1)
-            self.start_full_sim()
-
-    def start_full_sim(self):
-        """ Runs the full simulation procedure """
-        self.warning_message()
-        self.avg_qauntities = []
-        for temp in self.tempurature:
-            self.create_cells()
-            print ("Current Tempurature: {0:.1f}".format(temp))
-            for  i in range(self.timesteps):
-                if i % 10 == 0:
-                    print("Current Sweep: {} out of {}".format(int(i), int(self.timesteps)))
-                for j in range(self.dimensions ** 2):
-                    self.glauber_procedure(temp)
-                if i >= 99 and i % 10 == 0:
-                    self.calculate_averages(temp)
-        self.finished_sim()
-
-    def calculate_averages(self, tempurature):
-        """ Calculate average energies and magnetisation of the system """
-        average_energy = sim_utils.calculate_total_energy(self.cells)
-        average_mag = sim_utils.calculate_total_mag(self.cells)
-        self.avg_qauntities.append("{},{},{}".format(str(tempurature), str(average_energy), str(average_mag)))
-
-    def anim_func(self, i):
-        """ Repimplemented from base class
-        Used for visual simulation of glauber dynamics
-        """
-        for i in range(self.dimensions ** 2):
-            self.glauber_procedure(self.tempurature)
-        self.im.set_array(self.cells)
-        self.check_sim()
-        yield self.im
-
-    def glauber_procedure(self, temp):
-        """Does the Glauber Procedure for the icing model"""
-        random_row = np.random.randint(0, self.dimensions)
-        random_col = np.random.randint(0, self.dimensions)
-        coordinate = (random_row, random_col)
-        energy_change = self.check_nieghbours(coordinate)
-        outcome = sim_utils.determine_flip_state(energy_change, temp)
-        if outcome == True:
-            newState = sim_utils.flip_array_state(self.cells[random_row, random_col])
-            self.cells[random_row, random_col] = newState
-
-    def check_nieghbours(self, coordinate):
-        """ Re-implemented from base class
-        Method for checking the closest neighbours in glauber simulation.
+        if self.algorithm == "multispin":
+            return sim_utils.unpack_cells(self.cells).astype(np.int8) * 2 - 1
+        return self.cells
+
+    def sweep(self, temp):
+        """Does a single sweep (N squared flip attempts) with the chosen algorithm"""
+        if self.algorithm == "checkerboard":
+            energy_change, mag_change = sim_utils.checkerboard_sweep(self.cells, self.sublattices, float(temp))
+            self.total_energy += energy_change
+            self.total_mag += mag_change
+        elif self.algorithm == "multispin":
+            sim_utils.multispin_sweep(self.cells, float(temp))
+            self.reset_totals()
+        elif self.algorithm == "swendsen":
+            sim_utils.swendsen_wang_sweep(self.cells, self.bonds, float(temp))
+            self.reset_totals()
+        elif self.algorithm == "wolff":
+            # keep flipping clusters until as many cells as a sweep have been flipped
+            flipped = 0
+            in_cluster = np.zeros(self.cells.shape, dtype=bool)
+            while flipped < self.dimensions ** 2:
+                flipped += sim_utils.wolff_update(self.cells, float(temp), in_cluster)
+            self.reset_totals()
+        elif self.algorithm == "random":
+            acceptance = self.prepare_field(temp)
+            rows = np.random.randint(0, self.dimensions, size=self.dimensions ** 2).tolist()
+            cols = np.random.randint(0, self.dimensions, size=self.dimensions ** 2).tolist()
+            random_numbers = np.random.uniform(0, 1, size=self.dimensions ** 2).tolist()
+            for i in range(self.dimensions ** 2):
+                self.glauber_procedure(rows[i], cols[i], random_numbers[i], acceptance)
+        if self.algorithm != "random":
+            # the other algorithms change the cells without keeping the field up to date
+            self.field_cells = None
+
+    def stacked_sweep(self, replicas, temps):
+        """Re-implemented from base class
+        Sweeps the whole stack of replicas at once with the checkerboard algorithm
         """
-        member, nieghbours = super().check_nieghbours(coordinate)
-        energy_change = sim_utils.determine_energy_change(member, nieghbours)
-        return energy_change
-
-    def finished_sim(self):
-        """ Method for finishing the simulation """
-        sim_info = "Glauber Simulation of {} Cells and {} TimeSteps\ntemp,avgEnergy,avgMag".format(self.dimensions ** 2, self.timesteps)
-        file_parameters = ["Glauber", self.dimensions, self.timesteps]
-        write_data(self.avg_qauntities, file_parameters, sim_info)
+        if self.algorithm == "checkerboard":
+            energy_changes, mag_changes = sim_utils.checkerboard_sweep(replicas, self.sublattices, temps[:, None, None])
+            self.energies += energy_changes
+            self.mags += mag_changes
+        else:
+            super().stacked_sweep(replicas, temps)
+
+    def glauber_procedure(self, random_row, random_col, random_number, acceptance):
+        """Does the Glauber Procedure for the icing model on the picked cell"""
+        energy_change = 2 * self.cells[random_row, random_col] * self.field[random_row, random_col]
+        if random_number <= acceptance[(energy_change + 8) // 4]:
+            self.flip_cell(random_row, random_col)
@@ -2,6 +2,7 @@ import numpy as np
 from tools.utils import sim_utils
 from packages.controller import SimulationPlane
 from tools.utils.general_utils import write_data
+from tools.utils.hashLife import HashLife
 
 class Gol(SimulationPlane):
     """ Class for simulating the Game Of Life system
@@ -13,27 +14,82 @@ class Gol(SimulationPlane):
     percentage: The Percentage of dead cells to be put in the array
 
     struct_mode: For inserting cells structures into an empty cell array
+
+    sim_type: simulation mode either 'visual', 'full' (no animation) or 'ensemble' (many random soups at once)
+
+    engine: how the board is stored and stepped either 'array', 'packed', 'hashlife' or 'sparse'
+
+    gen_step: number of generations the board is advanced by every timestep
+
+    detect_cycles: stops the simulation once the board repeats a recent state
+
+    ensemble_size: number of random soups at each percentage in the ensemble simulation
     """
-    def __init__(self, dimensions, timesteps, percentage, struct_mode):
+    sim_types = ("visual", "full", "ensemble")
+    tile_sizes = (8, 16, 32)
+    target_tiles = 16
+    cycle_history = 64
+
+    def __init__(self, dimensions, timesteps, percentage, struct_mode, sim_type="visual", engine="array", gen_step=1, detect_cycles=False, ensemble_size=100):
         """
         GameOfLife Constructor
         """
         super().__init__(dimensions, timesteps)
         self.percentage = percentage
         self.struct_mode = struct_mode
-        self.create_cells()
-        self.create_figure()
+        self.sim_type = self.check_choice("sim_type", sim_type, self.sim_types)
+        self.engine = engine
+        self.gen_step = int(gen_step) if gen_step != None else 1
+        self.detect_cycles = detect_cycles == True
+        self.ensemble_size = int(ensemble_size) if ensemble_size != None else 100
 
     def create_cells(self):
-        """Create Cell Array and adds more data to figure object"""
+        """Create Cell Array and the buffers the next generation is worked out in"""
         if self.struct_mode == None or self.struct_mode == "none":
-            self.percentage = int(self.percentage) / 100
-            probabilities = [1 - self.percentage, self.percentage]
-            self.cells = np.random.choice([1, 0], size = (self.dimensions, self.dimensions), p = probabilities)
+            dead_fraction = int(self.percentage) / 100
+            probabilities = [1 - dead_fraction, dead_fraction]
+            self.cells = np.random.choice(
+                np.array([1, 0], dtype=np.uint8), size = (self.dimensions, self.dimensions), p = probabilities)
         else:
-            self.cells = np.zeros(shape= (self.dimensions, self.dimensions))
+            self.cells = np.zeros(shape= (self.dimensions, self.dimensions), dtype=np.uint8)
             self.structure_injection()
-        self.new_cells = np.copy(self.cells)
+        if self.engine == "packed" and self.dimensions % 64 != 0:
+            print("Runtime Warning: packed needs dimensions that are a multiple of 64, using array instead.")
+            self.engine = "array"
+        if self.engine == "sparse":
+            # the largest tile that still splits the board into target_tiles tiles a side,
+            # so small boards get small tiles rather than a few tiles that are always active
+            fitting = [size for size in self.tile_sizes if self.dimensions % size == 0]
+            enough = [size for size in fitting if self.dimensions // size >= self.target_tiles]
+            self.tile = max(enough) if len(enough) > 0 else min(fitting) if len(fitting) > 0 else None
+            if self.tile == None:
+                print("Runtime Warning: sparse needs dimensions that are a multiple of 8, using array instead.")
+                self.engine = "array"
+        if self.engine == "packed":
+            # 64 cells are packed into the bits of each word
+            self.cells = sim_utils.pack_cells(self.cells)
+        elif self.engine == "hashlife":
+            # the universe is unbounded, the cells only keep the window that is shown
+            self.life = HashLife(self.cells)
+        elif self.engine == "sparse":
+            # every tile is worked out on the first generation
+            tiles = self.dimensions // self.tile
+            self.active = np.ones((tiles, tiles), dtype=bool)
+            self.active_counts = []
+        else:
+            self.new_cells = np.empty_like(self.cells)
+            self.counts = np.empty_like(self.cells)
+            self.scratch = np.empty_like(self.cells)
+        self.generation = 0
+        self.cycle = None
+        # hashes of the most recent boards and the generation they were seen
+        self.history = {self.board_key(): 0} if self.detect_cycles else {}
+
+    def get_cells(self):
+        """Returns the board as an array of 0 and 1 whatever the engine"""
+        if self.engine == "packed":
+            return sim_utils.unpack_cells(self.cells)
+        return self.cells
 
     def create_figure(self):
         """ Reimplemented from base class
@@ -42,7 +98,84 @@ class Gol(SimulationPlane):
         """
         super().create_figure()
         self.axes.set_title("The Game Of Life For {} Cells".format(self.dimensions ** 2))
-        self.im = self.axes.imshow(self.cells, animated=True)
+        self.im = self.axes.imshow(self.get_cells(), animated=True, vmin=0, vmax=1)
+
+    def start_sim(self):
+        """ Re-implemented from base class
+
+        Runs either the visual simulation with matplotlib or full without
+        """
+        if self.sim_type == "ensemble":
+            self.start_ensemble_sim()
+            return
+        self.create_cells()
+        if self.sim_type == "full":
+            self.start_full_sim()
+        else:
+            self.create_figure()
+            super().start_sim()
+
+    def start_full_sim(self):
+        """ Runs the generations without any animation """
+        for i in range(self.timesteps):
+            if i % 10 == 0:
+                print("Current Timestep: {} out of {}".format(i, self.timesteps))
+            self.gol_procedure()
+            if self.struct_mode == "glider":
+                self.check_centre_of_mass()
+            if self.detect_cycles and self.check_cycle():
+                break
+        print ("Simulation Completed")
+        self.finished_sim()
+
+    def start_ensemble_sim(self):
+        """ Runs ensemble_size random soups at every percentage as one stack of boards
+
+        Every board is hashed each generation and checked against its recent history,
+        boards that have settled into a still life or oscillator are dropped from the stack
+        """
+        if self.engine != "array":
+            print("Runtime Warning: ensemble simulations step a stack of arrays, using array instead.")
+            self.engine = "array"
+        self.percentage = np.arange(10, 100, 10)
+        percentages = np.repeat(self.percentage, self.ensemble_size)
+        boards = (np.random.uniform(0, 1, size=(len(percentages), self.dimensions, self.dimensions))
+            >= percentages[:, None, None] / 100).astype(np.uint8)
+        new_boards, counts, scratch = np.empty_like(boards), np.empty_like(boards), np.empty_like(boards)
+        # random weights make a 64 bit hash of each board from a single dot product
+        weights = np.random.randint(0, 2 ** 63, size=self.dimensions ** 2, dtype=np.uint64)
+        history = np.zeros((self.cycle_history, len(boards)), dtype=np.uint64)
+        history_gens = np.full(self.cycle_history, -1)
+        live_boards = np.arange(len(boards))
+        stable_gens = np.full(len(boards), -1)
+        periods = np.zeros(len(boards), dtype=int)
+        live_counts = np.zeros(len(boards), dtype=int)
+        for generation in range(self.timesteps + 1):
+            if generation % 10 == 0:
+                print("Current Generation: {} out of {} ({} Boards Unsettled)".format(generation, self.timesteps, len(live_boards)))
+            hashes = boards.reshape(len(boards), -1).astype(np.uint64) @ weights
+            matches = (history[:, live_boards] == hashes) & (history_gens[:, None] >= 0)
+            settled = np.any(matches, axis=0)
+            if np.any(settled):
+                first_seen = history_gens[np.argmax(matches[:, settled], axis=0)]
+                stable_gens[live_boards[settled]] = first_seen
+                periods[live_boards[settled]] = generation - first_seen
+                live_counts[live_boards[settled]] = np.sum(boards[settled], axis=(1, 2))
+                live_boards = live_boards[~settled]
+                boards = boards[~settled]
+                new_boards, counts, scratch = np.empty_like(boards), np.empty_like(boards), np.empty_like(boards)
+            if len(live_boards) == 0 or generation == self.timesteps:
+                break
+            history[generation % self.cycle_history, live_boards] = hashes[~settled]
+            history_gens[generation % self.cycle_history] = generation
+            sim_utils.life_step(boards, new_boards, counts, scratch)
+            boards, new_boards = new_boards, boards
+        live_counts[live_boards] = np.sum(boards, axis=(1, 2))
+        print ("Simulation Completed")
+        self.ensemble_values = [
+            "{},{},{},{},{}".format(percentages[board], board % self.ensemble_size, stable_gens[board], periods[board], live_counts[board])
+            for board in range(len(percentages))]
+        self.finished_ensemble()
 
     def structure_injection(self):
         """ Puts known game of life strucutres into cell array """
@@ -61,8 +194,9 @@ class Gol(SimulationPlane):
         Used for visual simulation of game of life
         """
         self.gol_procedure()
-        self.cells = np.copy(self.new_cells)
-        self.im.set_array(self.cells)
+        self.im.set_array(self.get_cells())
+        if self.detect_cycles:
+            self.check_cycle()
         self.check_sim()
         if self.struct_mode == "glider":
             self.check_centre_of_mass()
@@ -71,47 +205,93 @@ class Gol(SimulationPlane):
     def check_sim(self):
         if self.index % 5 == 0:
             print ("Timesteps Completed: {} out of {}".format(self.index, self.timesteps))
-        if self.index == self.timesteps:
+        if self.index == self.timesteps or self.cycle != None:
             print ("Simulation Completed")
-            if self.struct_mode == "glider":
-                self.finished_sim()
+            self.finished_sim()
             self.end_simulation()
         self.index += 1
 
+    def board_key(self):
+        """Hashes the current board so repeated states can be looked up"""
+        if self.engine == "hashlife":
+            rows, cols = self.life.live_cells()
+            order = np.lexsort((cols, rows))
+            return hash((rows[order].tobytes(), cols[order].tobytes()))
+        return hash(self.cells.tobytes())
+
+    def check_cycle(self):
+        """Checks the board against the recent history for a still life or oscillator
+
+        The period is found to the nearest timestep so is a multiple of gen_step
+        """
+        key = self.board_key()
+        if key in self.history:
+            self.cycle = (self.generation, self.generation - self.history[key])
+            print("Cycle Found: period {} at generation {}".format(self.cycle[1], self.cycle[0]))
+            return True
+        self.history[key] = self.generation
+        if len(self.history) > self.cycle_history:
+            del self.history[next(iter(self.history))]
+        return False
+
     def gol_procedure(self):
-        """ Does the game of life picking procedure """
-        for rows in range(self.dimensions):
-            for cols in range(self.dimensions):
-                coordinate = (rows, cols)
-                member, nieghbours = super().check_all_nieghbours(coordinate)
-                live_sum = sum(nieghbours)
-                number = self.check_life(member, live_sum)
-                if self.new_cells[rows, cols] != number:
-                    self.new_cells[rows, cols] = number
-
-    def check_life(self, member, live_sum):
-        if member == 1:
-            if live_sum < 2 or live_sum > 3:
-                return 0
-            else:
-                return 1
+        """ Does the game of life procedure for the whole board at once, gen_step times """
+        self.generation += self.gen_step
+        if self.engine == "hashlife":
+            self.life.advance(self.gen_step)
+            self.cells = self.life.window(0, 0, self.dimensions)
+        elif self.engine == "packed":
+            for i in range(self.gen_step):
+                self.cells = sim_utils.packed_life_step(self.cells)
+        elif self.engine == "sparse":
+            for i in range(self.gen_step):
+                self.active_counts.append(np.count_nonzero(self.active))
+                self.active = sim_utils.sparse_life_step(self.cells, self.active, self.tile)
         else:
-            if live_sum == 3:
-                return 1
-            else:
-                return 0
+            for i in range(self.gen_step):
+                sim_utils.life_step(self.cells, self.new_cells, self.counts, self.scratch)
+                self.cells, self.new_cells = self.new_cells, self.cells
 
     def check_centre_of_mass(self):
-        """Checks the Center of mass for a given glider structure"""
-        x, y = np.nonzero(self.cells)
+        """Checks the Center of mass for a given glider structure
+
+        Hashlife uses every live cell of its unbounded plane so the glider never wraps
+        """
+        if self.engine == "hashlife":
+            x, y = self.life.live_cells()
+        else:
+            x, y = np.nonzero(self.get_cells())
         com_x = np.average(x)
         com_y = np.average(y)
         self.com_values.append("{},{}".format(com_x, com_y))
 
+    def finished_ensemble(self):
+        """ Saves the settling generation, period and final live count of every board in the ensemble """
+        sim_info = "Game Of Life Ensemble of {} Boards of {} Cells and {} Generations (stableGen of -1 Never Settled)".format(
+            len(self.ensemble_values), self.dimensions ** 2, self.timesteps)
+        sim_info += "\npercentage,board,stableGen,period,liveCount"
+        sim_data = ["GoLEnsemble", self.dimensions, self.timesteps]
+        write_data(self.ensemble_values, sim_data, sim_info)
+
     def finished_sim(self):
         """ For Finishing the Sim """
         if self.struct_mode == "glider":
-            sim_info = "Game Of Life Simulation of {} Cells and {} Timesteps\ncomX,comY".format(self.dimensions ** 2, self.timesteps)
+            sim_info = "Game Of Life Simulation of {} Cells and {} Timesteps".format(self.dimensions ** 2, self.timesteps)
+            if self.gen_step > 1:
+                sim_info += " ({} Generations Per Timestep)".format(self.gen_step)
+            sim_info += "\ncomX,comY"
             sim_data = ["GoL", self.dimensions, self.timesteps]
             write_data(self.com_values, sim_data, sim_info)
-
+        if self.engine == "sparse":
+            active_data = ["{},{}".format(generation, count) for generation, count in enumerate(self.active_counts)]
+            sim_info = "Game Of Life Active Tiles of {} Cells and {} Timesteps ({} by {} Tiles)\ngeneration,activeTiles".format(
+                self.dimensions ** 2, self.timesteps, self.tile, self.tile)
+            sim_data = ["GoLActive", self.dimensions, self.timesteps]
+            write_data(active_data, sim_data, sim_info)
+        if self.detect_cycles:
+            # a period of 0 means no cycle was found before the timesteps ran out
+            generation, period = self.cycle if self.cycle != None else (self.generation, 0)
+            sim_info = "Game Of Life Cycle Detection of {} Cells and {} Timesteps\ngeneration,period".format(
+                self.dimensions ** 2, self.timesteps)
+            sim_data = ["GoLCycle", self.dimensions, self.timesteps]
+            write_data(["{},{}".format(generation, period)], sim_data, sim_info)
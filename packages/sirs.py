@@ -1,5 +1,6 @@
 import numpy as np
 from packages.controller import SimulationPlane
+from tools.utils import sim_utils
 from tools.utils.general_utils import write_data
 
 class Sirs(SimulationPlane):
@@ -9,24 +10,50 @@ class Sirs(SimulationPlane):
 
     timesteps: number of timesteps for the simulation
 
-    dyn_mode: different developing states either 'none', absorbing', 'dynamic', 'cyclic' or 'half'
+    dyn_mode: different developing states either 'none', absorbing', 'dynamic', 'cyclic', 'half', 'cut'
+    or 'adaptive' (full simulation refining the p1 p3 grid around sharp changes)
 
-    sim_type: simulation dyn_mode either 'visual' or 'full'
+    sim_type: simulation dyn_mode either 'visual', 'full' or 'ensemble' (the full, cut and
+    adaptive simulations with every probability point run at once as a stack of lattices)
 
     prob: probabilities that are given for p2 if none all probs are 1
+
+    algorithm: sweep algorithm either 'random', 'batched' or 'gillespie' (continuous time,
+    every step is a transition)
+
+    adaptive_start: grid spacing of p1 and p3 the adaptive simulation starts from
+
+    adaptive_resolution: finest grid spacing the adaptive simulation refines down to
+
+    refine_threshold: how far the average infected fraction in the middle of a square has to be
+    from the straight line through its corners for the adaptive simulation to split it
+
+    variance_threshold: the same for the variance, as a fraction of the range of the variances
     """
-    def __init__(self, dimensions, timesteps, sim_type, dyn_mode, prob):
+    sim_types = ("visual", "full", "ensemble")
+    algorithms = ("random", "batched", "gillespie")
+    noise_sigmas = 3
+
+    def __init__(self, dimensions, timesteps, sim_type, dyn_mode, prob, algorithm="random",
+                    adaptive_start=0.2, adaptive_resolution=0.025, refine_threshold=0.02, variance_threshold=0.05):
         """
         Sirs Constuctor
         """
         super().__init__(dimensions, timesteps)
-        self.sim_type = sim_type
+        self.sim_type = self.check_choice("sim_type", sim_type, self.sim_types)
         self.dyn_mode = dyn_mode
         self.probalbilities = prob
+        self.algorithm = self.check_choice("algorithm", algorithm, self.algorithms)
+        self.adaptive_start = float(adaptive_start) if adaptive_start != None else 0.2
+        self.adaptive_resolution = float(adaptive_resolution) if adaptive_resolution != None else 0.025
+        self.refine_threshold = float(refine_threshold) if refine_threshold != None else 0.02
+        self.variance_threshold = float(variance_threshold) if variance_threshold != None else 0.05
+        self.event_cells = None
 
     def create_cells(self):
         """ Create Cell Array and adds more data to figure object """
         self.cells = np.random.choice([1, 0, -1], size=(self.dimensions, self.dimensions))
+        self.count_infected()
         if self.dyn_mode != "none":
             self.prob_by_mode()
         else:
@@ -64,10 +91,15 @@ class Sirs(SimulationPlane):
             self.create_figure()
             super().start_sim()
         else:
+            if self.sim_type == "ensemble" and self.algorithm != "batched":
+                print("Runtime Warning: ensemble simulations sweep a stack of lattices, using batched instead.")
+                self.algorithm = "batched"
             if self.dyn_mode == "half":
                 self.start_half_sim()
             elif self.dyn_mode == "cut":
                 self.start_cut_sim()
+            elif self.dyn_mode == "adaptive":
+                self.start_adaptive_sim()
             else:
                 self.start_full_sim()
 
@@ -76,45 +108,165 @@ class Sirs(SimulationPlane):
         self.sim_data = []
         p1_amounts = np.arange(0, 1.05, 0.05)
         p3_amounts = np.arange(0, 1.05, 0.05)
+        if self.sim_type == "ensemble":
+            p1_values, p3_values = [grid.ravel() for grid in np.meshgrid(p1_amounts, p3_amounts, indexing="ij")]
+            averages, absorbed_at = self.run_ensemble(p1_values, p3_values)
+            for layer in range(len(p1_values)):
+                self.sim_data.append("{},{},{},{}".format(p1_values[layer], p3_values[layer], averages[0, layer], absorbed_at[layer]))
+            self.finished_sim("SIRS")
+            return
         for prob1 in range(len(p1_amounts)):
             for prob2 in range(len(p3_amounts)):
                 print ("Probabilities - p1 : {}, p3 : {}".format(p1_amounts[prob1], p3_amounts[prob2]))
                 self.probalbilities = [p1_amounts[prob1], 0.5, p3_amounts[prob2]]
                 self.create_cells()
-                average_data = []
-                for sweep in range(self.timesteps):
-                    for i in range(self.dimensions ** 2):
-                        self.sirs_procedure()
-                    if sweep % 10 == 0:
-                        print ("Sweep {} out of {}".format(sweep, self.timesteps))
-                    if sweep % 10 == 0 and sweep > 99:
-                        average_data.append(self.caculate_averages())
+                average_data, absorbed_at = self.run_sweeps()
                 avg_i = np.average([x[0] for x in average_data])
-                self.sim_data.append("{},{},{}".format(p1_amounts[prob1], p3_amounts[prob2], avg_i))
+                self.sim_data.append("{},{},{},{}".format(p1_amounts[prob1], p3_amounts[prob2], avg_i, absorbed_at))
         self.finished_sim("SIRS")
 
     def start_cut_sim(self):
         self.sim_data = []
         p1_amounts = np.arange(0.2, 0.52, 0.02)
         p3_amounts = np.arange(0.2, 0.52, 0.02)
+        if self.sim_type == "ensemble":
+            p1_values, p3_values = [grid.ravel() for grid in np.meshgrid(p1_amounts, p3_amounts, indexing="ij")]
+            averages, absorbed_at = self.run_ensemble(p1_values, p3_values)
+            for layer in range(len(p1_values)):
+                self.sim_data.append("{},{},{},{}".format(p1_values[layer], p3_values[layer], averages[1, layer], absorbed_at[layer]))
+            self.finished_sim("SIRSCut")
+            return
         for prob1 in range(len(p1_amounts)):
             for prob2 in range(len(p3_amounts)):
                 print ("Probability p1 : {}".format(p1_amounts[prob1]))
                 self.probalbilities = [p1_amounts[prob1], 0.5, p3_amounts[prob2]]
                 print(self.probalbilities)
                 self.create_cells()
-                average_data = []
-                for sweep in range(self.timesteps):
-                    for i in range(self.dimensions ** 2):
-                        self.sirs_procedure()
-                    if sweep % 10 == 0:
-                        print ("Sweep {} out of {}".format(sweep, self.timesteps))
-                    if sweep % 10 == 0 and sweep > 99:
-                        average_data.append(self.caculate_averages())
+                average_data, absorbed_at = self.run_sweeps()
                 avg_var = np.average([x[1] for x in average_data])
-                self.sim_data.append("{},{},{}".format(p1_amounts[prob1], p3_amounts[prob2], avg_var))
+                self.sim_data.append("{},{},{},{}".format(p1_amounts[prob1], p3_amounts[prob2], avg_var, absorbed_at))
         self.finished_sim("SIRSCut")
 
+    def run_ensemble(self, p1_values, p3_values):
+        """Runs every (p1, p3) point at once as a stack of lattices, one layer per point
+
+        Every layer uses the same picked sites each sweep (with its own random numbers)
+        so the batches are only worked out once. Returns the time averaged infected fraction
+        and variance of each layer followed by their time averaged squares, and the sweep each
+        layer became absorbing (-1 if it never did). Absorbed layers are dropped from the
+        stack and measure zero from then on.
+        """
+        layers = len(p1_values)
+        print ("Ensemble of {} Probability Points".format(layers))
+        self.probalbilities = [p1_values[:, None], np.full((layers, 1), 0.5), p3_values[:, None]]
+        self.cells = np.random.choice([1, 0, -1], size=(layers, self.dimensions, self.dimensions))
+        self.count_infected()
+        totals = np.zeros((4, layers))
+        active = np.arange(layers)
+        absorbed_at = np.full(layers, -1)
+        for sweep in range(self.timesteps):
+            self.sweep()
+            if sweep % 10 == 0:
+                print ("Sweep {} out of {} ({} Layers Active)".format(sweep, self.timesteps, len(active)))
+            if sweep % 10 == 0 and sweep > 99:
+                infected_avg, infected_var = self.caculate_averages()
+                totals[:, active] += infected_avg, infected_var, infected_avg ** 2, infected_var ** 2
+            absorbed = self.infected == 0
+            if np.any(absorbed):
+                absorbed_at[active[absorbed]] = sweep
+                active = active[~absorbed]
+                self.cells, self.infected = self.cells[~absorbed], self.infected[~absorbed]
+                self.probalbilities = [prob[~absorbed] for prob in self.probalbilities]
+                if len(active) == 0:
+                    break
+        return totals / len(range(100, self.timesteps, 10)), absorbed_at
+
+    def start_adaptive_sim(self):
+        """Samples p1 and p3 on a coarse grid and keeps splitting the squares where the
+        average infected fraction or its variance changes sharply, down to adaptive_resolution
+
+        The middle of each edge and the centre of a square are sampled and the square is
+        split when either quantity there is further from the straight line (or plane) through
+        its corners than its threshold (refine_threshold for the average, variance_threshold of
+        the range sampled so far for the variance), and further than noise_sigmas of its
+        standard errors (from how much it moved over each run), so smooth slopes and noise
+        alone do not split it
+        """
+        self.sim_data = []
+        self.samples = {}
+        self.measurements = max(1, len(range(100, self.timesteps, 10)))
+        step = 1 / max(1, int(round(1 / self.adaptive_start)))
+        squares = [(round(p1, 6), round(p3, 6)) for p1 in np.arange(0, 1, step) for p3 in np.arange(0, 1, step)]
+        self.sample_points([(p1 + i, p3 + j) for p1, p3 in squares for i in (0, step) for j in (0, step)])
+        while len(squares) > 0 and step / 2 >= self.adaptive_resolution:
+            half = step / 2
+            print ("Adaptive Step {} With {} Squares".format(step, len(squares)))
+            # the middle point and the points it should lie between if the square is smooth
+            checks = [((p1 + half, p3), [(p1, p3), (p1 + step, p3)]) for p1, p3 in squares] + \
+                [((p1 + half, p3 + step), [(p1, p3 + step), (p1 + step, p3 + step)]) for p1, p3 in squares] + \
+                [((p1, p3 + half), [(p1, p3), (p1, p3 + step)]) for p1, p3 in squares] + \
+                [((p1 + step, p3 + half), [(p1 + step, p3), (p1 + step, p3 + step)]) for p1, p3 in squares] + \
+                [((p1 + half, p3 + half), [(p1 + i, p3 + j) for i in (0, step) for j in (0, step)]) for p1, p3 in squares]
+            self.sample_points([middle for middle, ends in checks])
+            variance_range = np.ptp([sample[1] for sample in self.samples.values()])
+            thresholds = (self.refine_threshold, self.variance_threshold * variance_range)
+            refine = set()
+            for index, (middle, ends) in enumerate(checks):
+                middle_sample = self.samples[self.round_point(middle)]
+                end_samples = [self.samples[self.round_point(end)] for end in ends]
+                # the average infected fraction then the variance, each against its own noise
+                for quantity, error in ((0, 3), (1, 4)):
+                    deviation = abs(middle_sample[quantity] - np.mean([sample[quantity] for sample in end_samples]))
+                    noise = self.noise_sigmas * np.sqrt(middle_sample[error] ** 2 + max(sample[error] for sample in end_samples) ** 2)
+                    if deviation > max(thresholds[quantity], noise):
+                        refine.add(squares[index % len(squares)])
+            step = half
+            squares = [(round(p1 + i, 6), round(p3 + j, 6)) for p1, p3 in sorted(refine) for i in (0, step) for j in (0, step)]
+        for point in sorted(self.samples):
+            self.sim_data.append("{},{},{},{}".format(point[0], point[1], self.samples[point][0], self.samples[point][2]))
+        self.finished_sim("SIRS")
+
+    @staticmethod
+    def round_point(point):
+        """Rounds a (p1, p3) point so points reached by different sums are the same key"""
+        return (round(point[0], 6), round(point[1], 6))
+
+    def sample_points(self, points):
+        """Runs the points of the adaptive simulation that have not been sampled yet, keeping
+        the average infected fraction and variance, the sweep it became absorbing and the
+        standard errors of the average infected fraction and variance
+        """
+        points = sorted({self.round_point(point) for point in points} - set(self.samples))
+        if len(points) == 0:
+            return
+        averages, spreads, absorbed_at = self.evaluate_points(np.array([p[0] for p in points]), np.array([p[1] for p in points]))
+        for index, point in enumerate(points):
+            errors = np.sqrt(spreads[:, index] / self.measurements)
+            self.samples[point] = (averages[0, index], averages[1, index], absorbed_at[index], errors[0], errors[1])
+
+    def evaluate_points(self, p1_values, p3_values):
+        """Runs a simulation at every (p1, p3) point, one after another or all at once as a
+        stack of lattices for the ensemble sim type
+
+        Returns the time averaged infected fraction and variance of each point, how much each
+        of them moved over the run (their variance over the measurements) and the sweep each
+        point became absorbing (-1 if it never did)
+        """
+        if self.sim_type == "ensemble":
+            averages, absorbed_at = self.run_ensemble(p1_values, p3_values)
+            return averages[:2], np.maximum(averages[2:] - averages[:2] ** 2, 0), absorbed_at
+        averages = np.zeros((2, len(p1_values)))
+        spreads = np.zeros((2, len(p1_values)))
+        absorbed_at = np.full(len(p1_values), -1)
+        for point in range(len(p1_values)):
+            print ("Probabilities - p1 : {}, p3 : {}".format(p1_values[point], p3_values[point]))
+            self.probalbilities = [p1_values[point], 0.5, p3_values[point]]
+            self.create_cells()
+            average_data, absorbed_at[point] = self.run_sweeps()
+            averages[:, point] = np.average(average_data, axis=0)
+            spreads[:, point] = np.var(average_data, axis=0)
+        return averages, spreads, absorbed_at
+
     def start_half_sim(self):
         self.sim_data = []
         immune_prob = np.arange(0, 1.01, 0.01)
@@ -126,22 +278,42 @@ class Sirs(SimulationPlane):
             probabilities = [i, prob_vals, prob_vals, prob_vals]
             self.cells = np.random.choice([2, 1, 0, -1], size=(self.dimensions, self.dimensions), p=probabilities)
             self.probalbilities = [0.5, 0.5, 0.5]
-            for sweep in range(self.timesteps):
-                for j in range(self.dimensions ** 2):
-                    self.sirs_procedure()
-                if sweep % 10 == 0:
-                    print ("Sweep {} out of {}".format(sweep,self.timesteps))
-                if sweep % 10 == 0 and sweep > 99:
-                    immune_data.append(self.caculate_averages())
+            self.count_infected()
+            immune_data, absorbed_at = self.run_sweeps()
             # Get average Intensity
             avg_i = np.average([x[0] for x in immune_data])
             dev_i = np.std([x[0] for x in immune_data])
-            self.sim_data.append("{},{},{}".format(i, avg_i, dev_i))
+            self.sim_data.append("{},{},{},{}".format(i, avg_i, dev_i, absorbed_at))
         self.finished_sim("SIRSHalf")
 
+    def run_sweeps(self):
+        """Sweeps the cells measuring every 10 sweeps from sweep 100
+
+        Once no cell is infected nothing can change, so the sweeps stop and the measurements
+        left are filled in as zero. Returns the measurements and the sweep the cells became
+        absorbing (-1 if they never did)
+        """
+        average_data = []
+        for sweep in range(self.timesteps):
+            self.sweep()
+            if sweep % 10 == 0:
+                print ("Sweep {} out of {}".format(sweep, self.timesteps))
+            if sweep % 10 == 0 and sweep > 99:
+                average_data.append(self.caculate_averages())
+            if self.infected == 0:
+                print ("Absorbing State Reached At Sweep {}".format(sweep))
+                remaining = len(range(100, self.timesteps, 10)) - len(average_data)
+                average_data.extend([(0.0, 0.0)] * remaining)
+                return average_data, sweep
+        return average_data, -1
+
+    def count_infected(self):
+        """Counts the infected sites from scratch (of each layer for a stack of cells)"""
+        self.infected = (self.cells == -1).sum(axis=(-2, -1))
+
     def caculate_averages(self):
-        """Calculate averages of the infected sites"""
-        infected_sites = (self.cells == -1).sum()
+        """Calculate averages of the infected sites (of each layer for a stack of cells)"""
+        infected_sites = (self.cells == -1).sum(axis=(-2, -1))
         infected_avg = infected_sites / (self.dimensions ** 2)
         infected_var = (infected_sites ** 2 - infected_avg ** 2) / self.dimensions ** 2
         return infected_avg, infected_var
@@ -150,12 +322,123 @@ class Sirs(SimulationPlane):
         """ Re-implemented from base class
         Method for doing the SIRS simulation procedure over N sweeps
         """
-        for i in range(self.dimensions ** 2):
-            self.sirs_procedure()
+        self.sweep()
         self.im.set_array(self.cells)
         self.check_sim()
         yield self.im
 
+    def sweep(self):
+        """Does a single sweep (N squared picks) with the chosen algorithm"""
+        if self.algorithm == "batched":
+            # the picks are drawn up front and done in batches that do not depend on each other
+            rows = np.random.randint(0, self.dimensions, size=self.dimensions ** 2)
+            cols = np.random.randint(0, self.dimensions, size=self.dimensions ** 2)
+            random_numbers = np.random.uniform(0, 1, size=self.cells.shape[:-2] + (self.dimensions ** 2,))
+            for batch in sim_utils.create_sirs_batches(rows, cols, self.dimensions):
+                self.infected += sim_utils.sirs_batch_update(
+                    self.cells, rows[batch], cols[batch], random_numbers[..., batch], self.probalbilities)
+        elif self.algorithm == "gillespie":
+            self.gillespie_sweep()
+        elif self.algorithm == "random":
+            for i in range(self.dimensions ** 2):
+                self.sirs_procedure()
+
+    def create_events(self):
+        """Creates the lists of sites that can change (susceptible with an infected
+        neighbour, infected and recovered) and the infected neighbour count of every site
+        """
+        sites = np.arange(self.dimensions ** 2).reshape(self.dimensions, self.dimensions)
+        self.event_neighbours = np.stack([
+            np.roll(sites, 1, axis=0), np.roll(sites, -1, axis=0),
+            np.roll(sites, 1, axis=1), np.roll(sites, -1, axis=1)], axis=-1).reshape(-1, 4).tolist()
+        self.event_states = self.cells.ravel().tolist()
+        self.infected_neighbours = sim_utils.neighbour_sum((self.cells == -1).astype(int)).ravel().tolist()
+        self.event_lists = [[], [], []]
+        self.event_positions = [-1] * self.dimensions ** 2
+        self.event_classes = [-1] * self.dimensions ** 2
+        for site, state in enumerate(self.event_states):
+            if state == 0 and self.infected_neighbours[site] > 0:
+                self.add_event(site, 0)
+            elif state == -1:
+                self.add_event(site, 1)
+            elif state == 1:
+                self.add_event(site, 2)
+        self.event_cells = self.cells
+        self.event_time = 0
+
+    def add_event(self, site, event_class):
+        """Adds a site to the list of an event class"""
+        self.event_positions[site] = len(self.event_lists[event_class])
+        self.event_classes[site] = event_class
+        self.event_lists[event_class].append(site)
+
+    def remove_event(self, site):
+        """Removes a site from the list of its event class by swapping in the last site"""
+        sites = self.event_lists[self.event_classes[site]]
+        last = sites.pop()
+        if last != site:
+            sites[self.event_positions[site]] = last
+            self.event_positions[last] = self.event_positions[site]
+        self.event_classes[site] = -1
+
+    def gillespie_sweep(self):
+        """Does a sweep worth of time of the continuous time (n-fold way) dynamics
+
+        Every site is picked once per sweep on average, so a site that can change does so
+        at its probability per sweep. Each step picks a transition weighted by these rates
+        and moves time on by an exponential waiting time in sweeps.
+        """
+        if self.event_cells is not self.cells:
+            self.create_events()
+        rates = [float(self.probalbilities[0]), float(self.probalbilities[1]), float(self.probalbilities[2])]
+        lists, states, counts = self.event_lists, self.event_states, self.infected_neighbours
+        end_time = int(self.event_time) + 1
+        random_numbers = []
+        while True:
+            class_rates = [rates[i] * len(lists[i]) for i in range(3)]
+            total_rate = sum(class_rates)
+            if len(random_numbers) < 2:
+                random_numbers = np.random.uniform(0, 1, size=2 * self.dimensions ** 2).tolist()
+            pick, wait = random_numbers.pop(), random_numbers.pop()
+            if total_rate == 0:
+                break
+            self.event_time -= np.log(1 - wait) / total_rate
+            # waiting times are memoryless so a step past the end of the sweep can be dropped
+            if self.event_time >= end_time:
+                break
+            pick *= total_rate
+            if pick < class_rates[0]:
+                event_class = 0
+            elif pick < class_rates[0] + class_rates[1]:
+                event_class, pick = 1, pick - class_rates[0]
+            else:
+                event_class, pick = 2, pick - class_rates[0] - class_rates[1]
+            site = lists[event_class][min(int(pick / rates[event_class]), len(lists[event_class]) - 1)]
+            self.remove_event(site)
+            if event_class == 0:
+                # infection, susceptible neighbours may now be able to change
+                states[site] = -1
+                self.add_event(site, 1)
+                for neighbour in self.event_neighbours[site]:
+                    counts[neighbour] += 1
+                    if states[neighbour] == 0 and counts[neighbour] == 1:
+                        self.add_event(neighbour, 0)
+            elif event_class == 1:
+                # recovery, susceptible neighbours may no longer be able to change
+                states[site] = 1
+                self.add_event(site, 2)
+                for neighbour in self.event_neighbours[site]:
+                    counts[neighbour] -= 1
+                    if states[neighbour] == 0 and counts[neighbour] == 0:
+                        self.remove_event(neighbour)
+            else:
+                states[site] = 0
+                if counts[site] > 0:
+                    self.add_event(site, 0)
+        self.event_time = end_time
+        self.cells[...] = np.array(states).reshape(self.dimensions, self.dimensions)
+        self.infected = len(lists[1])
+
     def sirs_procedure(self):
         """Does the SIRS picking procedure"""
         random_row = np.random.randint(0, self.dimensions)
@@ -172,10 +455,12 @@ class Sirs(SimulationPlane):
             if (-1 in nieghbour_a):
                 if random_numb < self.probalbilities[0]:
                     self.cells[coordinate[0], coordinate[1]] = -1
+                    self.infected += 1
         # ! Recovery Clause
         elif (c_agent == -1):
             if random_numb < self.probalbilities[1]:
                 self.cells[coordinate[0], coordinate[1]] = 1
+                self.infected -= 1
         # ! Suceptible Clause
         elif (c_agent == 1) :
             if random_numb < self.probalbilities[2]:
@@ -186,11 +471,11 @@ class Sirs(SimulationPlane):
         # TODO check that the correct information is being saved
         """For Finishing the Sim"""
         if identifier == "SIRS":
-            tables_heads = "p1, p3, avgI"
+            tables_heads = "p1, p3, avgI, absorbedAt"
         elif identifier == "SIRSHalf":
-            tables_heads = "iProb, avgI, devI"
+            tables_heads = "iProb, avgI, devI, absorbedAt"
         elif identifier == "SIRSCut":
-            tables_heads = "p1, varI"
+            tables_heads = "p1, varI, absorbedAt"
 
         sim_info = "{} Simulation with {} Cells and {} TimeSteps\n{}".format(identifier, self.dimensions ** 2, self.timesteps, tables_heads)
         file_data = (identifier, self.dimensions, self.timesteps)
@@ -12,6 +12,8 @@ class Grapher(UtilityBase):
         self.choices = [
             ("kawasaki", self.icing_plots),
             ("glauber", self.icing_plots),
+            ("kawasakiswaps", self.swap_plot),
+            ("glauberswaps", self.swap_plot),
             ("sirs", self.aver_plot),
             ("sirshalf", self.immune_plot),
             ("sirscut", self.var_plot),
@@ -54,18 +56,34 @@ class Grapher(UtilityBase):
             ax.set_title(plot_titles[i])
         plt.show()
 
+    def swap_plot(self, identifier, size, sweeps):
+        """Plots the replica swap acceptance of a tempering dataset"""
+        low_temps, high_temps, acceptance = sim_utils.get_swap_data(self.file_data)
+        plot_title = "Replica Swap Acceptance For The {} Sim With {} Cells and {} Sweeps".format(
+            identifier.replace("swaps", "").title(), int(size) ** 2, sweeps)
+        self.figure.suptitle(plot_title)
+        plt.xlabel("Tempurature (Middle Of Each Pair)")
+        plt.ylabel("Swap Acceptance")
+        plt.plot((low_temps + high_temps) / 2, acceptance, marker="o")
+        plt.ylim(0, 1)
+        plt.show()
+
     def aver_plot(self, indentifier, size, sweeps):
         contour_list = sim_utils.get_infection_data(self.file_data, "Full")
         p1_vals = list(set(contour_list[0]))
         p3_vals = list(set(contour_list[1]))
-        avg_vals = contour_list[2].reshape(len(p1_vals), len(p3_vals))
         plot_xlabel = "p1"
         plot_ylabel = "p3"
         plot_title = "Contour Plot Showing The Averages Of Suceptible Cells"
         self.figure.suptitle(plot_title)
         plt.xlabel(plot_xlabel)
         plt.ylabel(plot_ylabel)
-        plt.contourf(avg_vals)
+        if len(p1_vals) * len(p3_vals) == len(contour_list[2]):
+            avg_vals = contour_list[2].reshape(len(p1_vals), len(p3_vals))
+            plt.contourf(avg_vals)
+        else:
+            # adaptive datasets sample an irregular set of points so are triangulated
+            plt.tricontourf(contour_list[0], contour_list[1], contour_list[2])
         plt.show()
 
     def var_plot(self, identifier, size, sweeps):
@@ -98,9 +116,16 @@ class Grapher(UtilityBase):
         energy_list = sim_utils.get_cahn_data(self.file_data)
         timesteps = energy_list[0]
         energies = energy_list[1]
-        plot_title = "Plot Showing The Free Energy Against Timesteps For The Cahn Hilliard Simulation"
-        self.figure.suptitle(plot_title)
-        plt.xlabel("Timesteps")
-        plt.ylabel("Energy")
-        plt.plot(energy_list[0], energy_list[1])
+        if len(energy_list) > 2:
+            plot_title = "Plot Showing The Free Energy Against Time For The Cahn Hilliard Simulation"
+            self.figure.suptitle(plot_title)
+            plt.xlabel("Time")
+            plt.ylabel("Energy")
+            plt.plot(energy_list[2], energy_list[1])
+        else:
+            plot_title = "Plot Showing The Free Energy Against Timesteps For The Cahn Hilliard Simulation"
+            self.figure.suptitle(plot_title)
+            plt.xlabel("Timesteps")
+            plt.ylabel("Energy")
+            plt.plot(energy_list[0], energy_list[1])
         plt.show()
@@ -86,6 +86,23 @@ def write_data(data, file_data, sim_info):
             data_file.write("{}\n".format(line))
     print ("Data succesfully saved as {}".format(data_file_name))
 
+def open_data_stream(file_data, sim_info):
+    """Opens a data file to be written a line at a time while a simulation runs"""
+    data_file_name = "{} - {} - {}.txt".format(*file_data)
+    data_file = open(join_path(DATAPATH, data_file_name), "w")
+    data_file.write("{}\n".format(sim_info))
+    return data_file
+
+def stream_data(data_file, line):
+    """Writes a single line of data to an open data file"""
+    data_file.write("{}\n".format(line))
+    data_file.flush()
+
+def close_data_stream(data_file):
+    """Closes a data file opened with open_data_stream"""
+    data_file.close()
+    print ("Data succesfully saved as {}".format(os.path.basename(data_file.name)))
+
 def check_directories():
     if os.path.isdir(DATAPATH) == False:
         os.mkdir("data")
@@ -0,0 +1,221 @@
+import numpy as np
+
+class Node(object):
+    """ A quadtree node of a game of life universe
+
+    level: the node covers 2 ** level by 2 ** level cells
+    nw, ne, sw, se: the four child nodes (None for single cells)
+    population: the number of live cells in the node
+    """
+    __slots__ = ("level", "nw", "ne", "sw", "se", "population")
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+
+
+class HashLife(object):
+    """ Hashlife game of life engine on an unbounded plane
+
+    Every distinct node is stored once (canonical) and the result of advancing
+    each node is memoised, so repeating patterns can be advanced by 2 ** k
+    generations in a single step.
+
+    cells: starting array of 0 and 1, the top left cell is at row 0, col 0
+    cache_limit: memoised nodes and results kept before garbage collecting
+    """
+    def __init__(self, cells, cache_limit=2 ** 20):
+        self.cache_limit = cache_limit
+        self.nodes = {}
+        self.results = {}
+        self.zeros = {}
+        self.off = Node(0, None, None, None, None, 0)
+        self.on = Node(0, None, None, None, None, 1)
+        self.generation = 0
+        self.create_root(np.asarray(cells))
+
+    def create_root(self, cells):
+        """Builds the root node from an array of cells"""
+        level = max(3, int(np.ceil(np.log2(max(cells.shape)))))
+        padded = np.zeros((2 ** level, 2 ** level), dtype=np.uint8)
+        padded[:cells.shape[0], :cells.shape[1]] = cells != 0
+        self.root = self.build(padded, 0, 0, level)
+        # the row and column of the top left cell of the root
+        self.origin = (0, 0)
+
+    def build(self, cells, row, col, level):
+        """Builds the node covering the square of cells at row, col"""
+        if level == 0:
+            return self.on if cells[row, col] else self.off
+        size = 2 ** level
+        if not cells[row:row + size, col:col + size].any():
+            return self.get_zero(level)
+        half = size // 2
+        return self.join(
+            self.build(cells, row, col, level - 1), self.build(cells, row, col + half, level - 1),
+            self.build(cells, row + half, col, level - 1), self.build(cells, row + half, col + half, level - 1))
+
+    def join(self, nw, ne, sw, se):
+        """Returns the canonical node made of the four children"""
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node(nw.level + 1, nw, ne, sw, se,
+                nw.population + ne.population + sw.population + se.population)
+            self.nodes[key] = node
+        return node
+
+    def get_zero(self, level):
+        """Returns the empty node of a given level"""
+        if level == 0:
+            return self.off
+        node = self.zeros.get(level)
+        if node is None:
+            zero = self.get_zero(level - 1)
+            node = self.join(zero, zero, zero, zero)
+            self.zeros[level] = node
+        return node
+
+    def centre(self, node):
+        """Returns the node one level up with the given node in its centre"""
+        zero = self.get_zero(node.level - 1)
+        return self.join(
+            self.join(zero, zero, zero, node.nw), self.join(zero, zero, node.ne, zero),
+            self.join(zero, node.sw, zero, zero), self.join(node.se, zero, zero, zero))
+
+    def inner(self, node):
+        """Returns the central node one level down"""
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def is_padded(self, node):
+        """Checks all the live cells are in the central quarter of the node"""
+        return node.level >= 3 and self.inner(self.inner(node)).population == node.population
+
+    def life_4x4(self, node):
+        """Works out the next generation of the central 2 by 2 of a level 2 node"""
+        grid = [
+            [node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+            [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+            [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+            [node.sw.sw, node.sw.se, node.se.sw, node.se.se]]
+        centre_cells = []
+        for row in (1, 2):
+            for col in (1, 2):
+                live_sum = sum(grid[row + i][col + j].population
+                    for i in (-1, 0, 1) for j in (-1, 0, 1) if i != 0 or j != 0)
+                alive = live_sum == 3 or (live_sum == 2 and grid[row][col].population == 1)
+                centre_cells.append(self.on if alive else self.off)
+        return self.join(*centre_cells)
+
+    def successor(self, node, step):
+        """Returns the central node one level down advanced by 2 ** step generations
+
+        step can be at most two less than the level of the node
+        """
+        key = (node, step)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if node.population == 0:
+            result = node.nw
+        elif node.level == 2:
+            result = self.life_4x4(node)
+        else:
+            step = min(step, node.level - 2)
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # the nine overlapping sub squares one level down
+            c1 = self.successor(nw, step)
+            c2 = self.successor(self.join(nw.ne, ne.nw, nw.se, ne.sw), step)
+            c3 = self.successor(ne, step)
+            c4 = self.successor(self.join(nw.sw, nw.se, sw.nw, sw.ne), step)
+            c5 = self.successor(self.join(nw.se, ne.sw, sw.ne, se.nw), step)
+            c6 = self.successor(self.join(ne.sw, ne.se, se.nw, se.ne), step)
+            c7 = self.successor(sw, step)
+            c8 = self.successor(self.join(sw.ne, se.nw, sw.se, se.sw), step)
+            c9 = self.successor(se, step)
+            if step < node.level - 2:
+                # already advanced far enough so just put the centre back together
+                result = self.join(
+                    self.join(c1.se, c2.sw, c4.ne, c5.nw), self.join(c2.se, c3.sw, c5.ne, c6.nw),
+                    self.join(c4.se, c5.sw, c7.ne, c8.nw), self.join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                result = self.join(
+                    self.successor(self.join(c1, c2, c4, c5), step),
+                    self.successor(self.join(c2, c3, c5, c6), step),
+                    self.successor(self.join(c4, c5, c7, c8), step),
+                    self.successor(self.join(c5, c6, c8, c9), step))
+        self.results[key] = result
+        return result
+
+    def expand_root(self):
+        """Puts the root in the centre of a node one level up"""
+        offset = 2 ** (self.root.level - 1)
+        self.root = self.centre(self.root)
+        self.origin = (self.origin[0] - offset, self.origin[1] - offset)
+
+    def shrink_root(self):
+        """Crops the root down while all the live cells stay inside it"""
+        while self.root.level > 3 and self.is_padded(self.root):
+            offset = 2 ** (self.root.level - 2)
+            self.root = self.inner(self.root)
+            self.origin = (self.origin[0] + offset, self.origin[1] + offset)
+
+    def advance(self, generations):
+        """Advances the universe by a number of generations, a power of two at a time"""
+        while generations > 0:
+            step = generations.bit_length() - 1
+            # pad so nothing can grow out of the area the result covers
+            while self.root.level < step + 3 or not self.is_padded(self.root):
+                self.expand_root()
+            self.expand_root()
+            offset = 2 ** (self.root.level - 2)
+            self.root = self.successor(self.root, step)
+            self.origin = (self.origin[0] + offset, self.origin[1] + offset)
+            generations -= 2 ** step
+            self.generation += 2 ** step
+            self.shrink_root()
+            if len(self.nodes) + len(self.results) > self.cache_limit:
+                self.collect()
+
+    def collect(self):
+        """Garbage collects the memoised results and any nodes not used by the root"""
+        self.results = {}
+        nodes = {}
+        stack = [self.root] + list(self.zeros.values())
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.level > 0 and (node.nw, node.ne, node.sw, node.se) not in nodes:
+                nodes[(node.nw, node.ne, node.sw, node.se)] = node
+                stack.extend([node.nw, node.ne, node.sw, node.se])
+        self.nodes = nodes
+
+    def live_cells(self):
+        """Returns the rows and cols of every live cell"""
+        rows = []
+        cols = []
+        stack = [(self.root, self.origin[0], self.origin[1])]
+        while len(stack) > 0:
+            node, row, col = stack.pop()
+            if node.population == 0:
+                continue
+            if node.level == 0:
+                rows.append(row)
+                cols.append(col)
+            else:
+                half = 2 ** (node.level - 1)
+                stack.extend([
+                    (node.nw, row, col), (node.ne, row, col + half),
+                    (node.sw, row + half, col), (node.se, row + half, col + half)])
+        return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+    def window(self, row, col, size):
+        """Returns the size by size array of cells with its top left at row, col"""
+        cells = np.zeros((size, size), dtype=np.uint8)
+        rows, cols = self.live_cells()
+        inside = (rows >= row) & (rows < row + size) & (cols >= col) & (cols < col + size)
+        cells[rows[inside] - row, cols[inside] - col] = 1
+        return cells
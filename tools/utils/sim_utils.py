@@ -10,6 +10,24 @@ get_icing_data: gets data back from an icing model
 calculate_total_energy: calculates the total energy of the array
 determine_energy: determines energy of a given cell
 calculate_total_mag: calcualtes the total magnetisation of the array
+neighbour_sum: sums the nearest neighbours of every cell
+create_acceptance_table: boltzmann acceptance probabilities of each energy change
+create_sublattices: creates masks of cells that share no neighbours
+checkerboard_sweep: vectorised metropolis sweep over the sublattices
+create_bonds: creates the cell index pairs of every bond on the lattice
+label_clusters: labels the clusters joined by bonds with a union find
+swendsen_wang_sweep: flips every swendsen wang cluster with probability a half
+wolff_update: grows and flips a single wolff cluster
+check_equilibrium: checks whether a series has stopped drifting
+pack_cells: packs a boolean array into uint64 words of 64 cells
+unpack_cells: unpacks uint64 words back into an array of 0 and 1
+shift_packed: shifts packed rows so every bit holds its left or right neighbour
+count_bits: counts the set bits in packed words
+random_packed: creates packed words with bits set with a given probability
+multispin_sweep: metropolis sweep of packed spins using bitwise operations
+calculate_packed_totals: total energy and magnetisation of packed spins
+create_bond_classes: splits the nearest neighbour bonds into non overlapping classes
+exchange_sweep: vectorised kawasaki sweep exchanging a class of bonds at a time
 """
 
 def determine_flip_state(energy_change, tempurature):
@@ -70,6 +88,13 @@ def get_icing_data(file_data, size):
     icing_list = [averageEnergy, averageMags, suceptibility, specificHeat]
     return icing_list, amounts
 
+def get_swap_data(file_data):
+    """Gets the replica swap acceptance of each pair of tempuratures from a tempering swaps file"""
+    low_temps = [float(data.split(",")[0]) for data in file_data]
+    high_temps = [float(data.split(",")[1]) for data in file_data]
+    acceptance = [float(data.split(",")[3]) for data in file_data]
+    return np.asarray(low_temps), np.asarray(high_temps), np.asarray(acceptance)
+
 def determine_energy(cells, coordinate):
     """Determines energy of state in the icing model"""
     row = coordinate[0]
@@ -84,18 +109,264 @@ def determine_energy(cells, coordinate):
     return energy
 
 def calculate_total_energy(cells):
-    """Calulates the toal energy of the system"""
-    energies = np.empty((len(cells), len(cells)))
-    for i in range(len(cells)):
-        for j in range(len(cells)):
-            energies[i, j] = determine_energy(cells, (i, j))
-    energy = np.sum(energies)
+    """Calulates the toal energy of the system (sum of determine_energy over all cells)
+
+    A stack of cell arrays gives the total energy of each one
+    """
+    energy = - np.sum(cells * neighbour_sum(cells), axis=(-2, -1))
     return energy
 
 def calculate_total_mag(cells):
     """Calculates the toal magnetisation of the system"""
     magnetisation = abs(np.sum(cells))
     return magnetisation
+
+def neighbour_sum(cells):
+    """Sums the four nearest neighbours of every cell (periodic boundaries)"""
+    return np.roll(cells, 1, axis=-2) + np.roll(cells, -1, axis=-2) + \
+        np.roll(cells, 1, axis=-1) + np.roll(cells, -1, axis=-1)
+
+def create_acceptance_table(tempurature):
+    """Creates the acceptance probability of every possible single flip energy change
+
+    The energy change of a flip is one of -8, -4, 0, 4 or 8 so is looked up at (change + 8) // 4
+    """
+    energy_changes = np.arange(-8, 9, 4)
+    return np.minimum(1, np.exp(- energy_changes / tempurature)).tolist()
+
+def create_sublattices(dimensions):
+    """Creates boolean masks of cells that share no nearest neighbours"""
+    if dimensions % 2 == 0:
+        rows, cols = np.indices((dimensions, dimensions))
+        colours = (rows + cols) % 2
+    else:
+        # odd lattices wrap a checkerboard onto itself so colour greedily
+        colours = np.full((dimensions, dimensions), -1)
+        for row in range(dimensions):
+            for col in range(dimensions):
+                used = {
+                    colours[row - 1, col], colours[(row + 1) % dimensions, col],
+                    colours[row, col - 1], colours[row, (col + 1) % dimensions]}
+                colour = 0
+                while colour in used:
+                    colour += 1
+                colours[row, col] = colour
+    return [colours == colour for colour in range(colours.max() + 1)]
+
+def checkerboard_sweep(cells, sublattices, tempurature):
+    """Does a metropolis sweep updating a whole sublattice at a time
+
+    Returns the change in total energy and magnetisation of the cells
+    """
+    total_energy_change = 0
+    total_mag_change = 0
+    for sublattice in sublattices:
+        energy_change = 2 * cells * neighbour_sum(cells)
+        random_numbers = np.random.uniform(0, 1, size=cells.shape)
+        probability_p = np.exp(- energy_change / tempurature)
+        flips = sublattice & (random_numbers <= probability_p)
+        # total energy counts every bond twice so changes by twice the flip energy
+        total_energy_change += 2 * np.sum(np.where(flips, energy_change, 0), axis=(-2, -1))
+        total_mag_change -= 2 * np.sum(np.where(flips, cells, 0), axis=(-2, -1))
+        cells[flips] *= -1
+    return total_energy_change, total_mag_change
+
+def create_bonds(dimensions):
+    """Creates the flat cell index pairs of every bond (right and down) on the lattice"""
+    index = np.arange(dimensions ** 2).reshape(dimensions, dimensions)
+    first = np.concatenate([index.ravel(), index.ravel()])
+    second = np.concatenate([np.roll(index, -1, axis=1).ravel(), np.roll(index, -1, axis=0).ravel()])
+    return first, second
+
+def label_clusters(size, first, second):
+    """Labels the clusters joined by the bonds with a vectorised union find
+
+    Every cell ends up labelled with the smallest cell index in its cluster
+    """
+    labels = np.arange(size)
+    while True:
+        # hook the root of each bond onto the smaller of the two roots
+        first_roots = labels[first]
+        second_roots = labels[second]
+        smallest = np.minimum(first_roots, second_roots)
+        np.minimum.at(labels, first_roots, smallest)
+        np.minimum.at(labels, second_roots, smallest)
+        # pointer jumping until every cell points straight at its root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels[first], labels[second]):
+            return labels
+
+def swendsen_wang_sweep(cells, bonds, tempurature):
+    """Does a swendsen wang update flipping every cluster with probability a half"""
+    flat_cells = cells.reshape(-1)
+    first, second = bonds
+    probability = 1 - np.exp(- 2 / tempurature)
+    active = (flat_cells[first] == flat_cells[second]) & \
+        (np.random.uniform(0, 1, size=len(first)) < probability)
+    labels = label_clusters(flat_cells.size, first[active], second[active])
+    cluster_flips = np.random.uniform(0, 1, size=flat_cells.size) < 0.5
+    flat_cells[cluster_flips[labels]] *= -1
+
+def wolff_update(cells, tempurature, in_cluster):
+    """Grows a wolff cluster from a random cell and flips it
+
+    in_cluster is a boolean array the shape of the cells that has to be all False, it
+    is used to mark the cluster and cleared again so it can be reused for every update
+    of a sweep. Returns the number of cells in the cluster
+    """
+    dimensions = len(cells)
+    probability = 1 - np.exp(- 2 / tempurature)
+    row, col = np.random.randint(0, dimensions, size=2)
+    state = cells[row, col]
+    in_cluster[row, col] = True
+    rows, cols = np.array([row]), np.array([col])
+    cluster = [(rows, cols)]
+    while rows.size > 0:
+        # try the bonds from the newest cells in the cluster to all their neighbours
+        rows, cols = np.concatenate([(rows + 1) % dimensions, (rows - 1) % dimensions, rows, rows]), \
+            np.concatenate([cols, cols, (cols + 1) % dimensions, (cols - 1) % dimensions])
+        added = (cells[rows, cols] == state) & ~in_cluster[rows, cols] & \
+            (np.random.uniform(0, 1, size=rows.size) < probability)
+        rows, cols = np.divmod(np.unique(rows[added] * dimensions + cols[added]), dimensions)
+        in_cluster[rows, cols] = True
+        cluster.append((rows, cols))
+    rows = np.concatenate([layer[0] for layer in cluster])
+    cols = np.concatenate([layer[1] for layer in cluster])
+    cells[rows, cols] *= -1
+    in_cluster[rows, cols] = False
+    return rows.size
+
+def check_equilibrium(series, window):
+    """Checks whether the mean of the last window of a series agrees with the window before it"""
+    if len(series) < 2 * window:
+        return False
+    older = np.asarray(series[-2 * window:-window], dtype=float)
+    newer = np.asarray(series[-window:], dtype=float)
+    error = np.sqrt((np.var(older) + np.var(newer)) / window)
+    return abs(np.mean(newer) - np.mean(older)) <= 2 * error
+
+def pack_cells(cells):
+    """Packs a boolean array into uint64 words, bit b of word w holds column 64w + b
+
+    The width of the array has to be a multiple of 64
+    """
+    packed = np.packbits(np.asarray(cells, dtype=bool), axis=-1, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u8")
+
+def unpack_cells(words):
+    """Unpacks uint64 words back into an array of 0 and 1"""
+    return np.unpackbits(np.ascontiguousarray(words, dtype="<u8").view(np.uint8), axis=-1, bitorder="little")
+
+def shift_packed(words, direction):
+    """Shifts packed rows (periodic) so every bit holds its right (1) or left (-1) neighbour"""
+    one = np.uint64(1)
+    last = np.uint64(63)
+    if direction == 1:
+        return (words >> one) | (np.roll(words, -1, axis=-1) << last)
+    return (words << one) | (np.roll(words, 1, axis=-1) >> last)
+
+def count_bits(words):
+    """Counts the set bits in packed words"""
+    if hasattr(np, "bitwise_count"):
+        return int(np.sum(np.bitwise_count(words), dtype=np.int64))
+    return int(np.sum(unpack_cells(words), dtype=np.int64))
+
+def random_packed(shape, probability, precision=16):
+    """Creates packed words with every bit set with the given probability
+
+    The probability is built up bitwise from its binary expansion to the given precision
+    """
+    if probability >= 1:
+        return np.full(shape, np.iinfo(np.uint64).max, dtype="<u8")
+    expansion = int(round(probability * 2 ** precision))
+    words = np.zeros(shape, dtype="<u8")
+    for bit in range(precision):
+        random_words = np.random.randint(0, 2 ** 64, size=shape, dtype=np.uint64)
+        if (expansion >> bit) & 1:
+            words |= random_words
+        else:
+            words &= random_words
+    return words
+
+def multispin_sweep(words, tempurature):
+    """Does a metropolis sweep of packed spins (set bit is up) one sublattice at a time
+
+    Flipping a spin with n anti aligned neighbours costs 8 - 4n, so n of two or more
+    always flips, n of one flips with exp(-4/T) and n of none with exp(-8/T)
+    """
+    rows = words.shape[-2]
+    even_columns = np.uint64(0x5555555555555555)
+    odd_columns = ~even_columns
+    probability = np.exp(- 4 / tempurature)
+    for colour in range(2):
+        sublattice = np.where((np.arange(rows) % 2 == colour)[:, None], even_columns, odd_columns)
+        top = words ^ np.roll(words, 1, axis=-2)
+        bottom = words ^ np.roll(words, -1, axis=-2)
+        left = words ^ shift_packed(words, -1)
+        right = words ^ shift_packed(words, 1)
+        any_anti = top | bottom | left | right
+        two_anti = (top & bottom) | (left & right) | ((top | bottom) & (left | right))
+        first_random = random_packed(words.shape, probability)
+        second_random = random_packed(words.shape, probability)
+        flips = two_anti | (any_anti & ~two_anti & first_random) | (~any_anti & first_random & second_random)
+        words ^= sublattice & flips
+
+def calculate_packed_totals(words):
+    """Calculates the total energy and magnetisation of packed spins
+
+    Uses the same energy as calculate_total_energy (every bond counted twice)
+    """
+    cells = words.shape[-2] * words.shape[-1] * 64
+    anti_bonds = count_bits(words ^ shift_packed(words, 1)) + count_bits(words ^ np.roll(words, -1, axis=-2))
+    energy = 4 * anti_bonds - 4 * cells
+    mag = 2 * count_bits(words) - cells
+    return energy, mag
+
+def create_bond_classes(dimensions):
+    """Splits the nearest neighbour bonds into 16 classes where no cell of a bond
+    touches a cell of another bond in the same class (dimensions a multiple of 4)
+
+    Each class is a tuple of the first rows, first cols, second rows and second cols
+    """
+    rows, cols = np.indices((dimensions, dimensions))
+    bond_classes = []
+    for across_offset in range(2):
+        for along_offset in range(4):
+            # horizontal bonds every other row and every fourth column
+            mask = (rows % 2 == across_offset) & (cols % 4 == along_offset)
+            bond_classes.append((rows[mask], cols[mask], rows[mask], (cols[mask] + 1) % dimensions))
+            # vertical bonds every other column and every fourth row
+            mask = (cols % 2 == across_offset) & (rows % 4 == along_offset)
+            bond_classes.append((rows[mask], cols[mask], (rows[mask] + 1) % dimensions, cols[mask]))
+    return bond_classes
+
+def exchange_sweep(cells, bond_classes, tempurature):
+    """Does a kawasaki sweep proposing an exchange across every bond once,
+    a whole class of bonds at a time in a random order
+
+    Returns the change in total energy of the cells
+    """
+    total_energy_change = 0
+    for index in np.random.permutation(len(bond_classes)):
+        first_rows, first_cols, second_rows, second_cols = bond_classes[index]
+        field = neighbour_sum(cells)
+        first = cells[..., first_rows, first_cols]
+        second = cells[..., second_rows, second_cols]
+        # flipping both cells counts their shared bond twice so it is added back on
+        energy_change = 2 * (first * field[..., first_rows, first_cols] + \
+            second * field[..., second_rows, second_cols]) + 4
+        random_numbers = np.random.uniform(0, 1, size=energy_change.shape)
+        exchanges = (first != second) & (random_numbers <= np.exp(- energy_change / tempurature))
+        # total energy counts every bond twice so changes by twice the exchange energy
+        total_energy_change += 2 * np.sum(np.where(exchanges, energy_change, 0), axis=-1)
+        cells[..., first_rows, first_cols] = np.where(exchanges, second, first)
+        cells[..., second_rows, second_cols] = np.where(exchanges, first, second)
+    return total_energy_change
+
 # -----------------------------------------------------------------
 """
 Game Of Life Utility Functions
@@ -188,6 +459,82 @@ GOLSTRUCTS = {
 def return_gol_structures(struct_name):
     return GOLSTRUCTS[struct_name]
 
+def life_step(cells, new_cells, counts, scratch):
+    """Steps game of life cells (0 or 1, periodic) into new_cells
+
+    counts and scratch are preallocated buffers the same shape and type as the cells
+    """
+    # each cell plus the cells above and below it
+    np.copyto(scratch, cells)
+    scratch[..., 1:, :] += cells[..., :-1, :]
+    scratch[..., :1, :] += cells[..., -1:, :]
+    scratch[..., :-1, :] += cells[..., 1:, :]
+    scratch[..., -1:, :] += cells[..., :1, :]
+    # plus the columns either side, less the cell itself
+    np.subtract(scratch, cells, out=counts)
+    counts[..., :, 1:] += scratch[..., :, :-1]
+    counts[..., :, :1] += scratch[..., :, -1:]
+    counts[..., :, :-1] += scratch[..., :, 1:]
+    counts[..., :, -1:] += scratch[..., :, :1]
+    # live cells survive with two neighbours and any cell with three is alive
+    np.equal(counts, 2, out=scratch)
+    scratch &= cells
+    np.equal(counts, 3, out=new_cells)
+    new_cells |= scratch
+
+def packed_life_step(words):
+    """Steps game of life cells packed into uint64 words (see pack_cells, periodic)
+
+    The eight neighbours are added up bitwise with full adders into a three bit count
+    (eight neighbours wraps round to zero which is dead either way)
+    """
+    left = shift_packed(words, -1)
+    right = shift_packed(words, 1)
+    neighbours = [left, right]
+    for row_shift in (1, -1):
+        neighbours += [np.roll(words, row_shift, axis=-2), np.roll(left, row_shift, axis=-2),
+            np.roll(right, row_shift, axis=-2)]
+    ones = np.zeros_like(words)
+    twos = np.zeros_like(words)
+    fours = np.zeros_like(words)
+    for neighbour in neighbours:
+        carry = ones & neighbour
+        ones ^= neighbour
+        fours ^= twos & carry
+        twos ^= carry
+    # alive with a count of three, or two if the cell was already alive
+    return twos & ~fours & (ones | words)
+
+def sparse_life_step(cells, active, tile):
+    """Steps game of life cells (0 or 1, periodic) in place, only working out the
+    tiles marked active (a boolean array with one entry per tile by tile block)
+
+    A cell can only change if something in its neighbourhood changed, so the tiles
+    that changed and every tile touching them are returned as the next active tiles
+    """
+    dimensions = cells.shape[0]
+    tile_rows, tile_cols = np.nonzero(active)
+    # every active tile with a one cell border gathered into a single stack
+    offsets = np.arange(-1, tile + 1)
+    rows = (tile_rows[:, None] * tile + offsets) % dimensions
+    cols = (tile_cols[:, None] * tile + offsets) % dimensions
+    blocks = cells[rows[:, :, None], cols[:, None, :]]
+    counts = np.zeros((len(tile_rows), tile, tile), dtype=np.uint8)
+    for i in range(3):
+        for j in range(3):
+            if i != 1 or j != 1:
+                counts += blocks[:, i:i + tile, j:j + tile]
+    old_blocks = blocks[:, 1:-1, 1:-1]
+    new_blocks = ((counts == 3) | ((counts == 2) & (old_blocks == 1))).astype(np.uint8)
+    changed = np.zeros_like(active)
+    changed[tile_rows, tile_cols] = np.any(new_blocks != old_blocks, axis=(1, 2))
+    tiles = cells.reshape(active.shape[0], tile, active.shape[1], tile)
+    tiles[tile_rows, :, tile_cols, :] = new_blocks
+    # spreading along the rows then the columns reaches all eight neighbouring tiles
+    next_active = changed | np.roll(changed, 1, axis=0) | np.roll(changed, -1, axis=0)
+    next_active |= np.roll(next_active, 1, axis=1) | np.roll(next_active, -1, axis=1)
+    return next_active
+
 def get_com_data(file_data):
     x_coordinate = [float(data.split(",")[0]) for data in file_data]
     y_coordinate = [float(data.split(",")[1]) for data in file_data]
@@ -198,6 +545,8 @@ def get_com_data(file_data):
 SIRS Utility Functions
 ---
 get_infection_data : sorts data from sirs data sets
+create_sirs_batches: splits a sequence of picked sites into batches that can be updated at once
+sirs_batch_update: applies the sirs rules to a batch of picked sites
 """
 def get_infection_data(file_data, identifier):
     if identifier == "Half":
@@ -217,10 +566,118 @@ def get_infection_data(file_data, identifier):
         data = [p1_data, p3_data, avgI]
     return data
 
+def create_sirs_batches(rows, cols, dimensions):
+    """Splits a sequence of picked sites into batches that can be updated at once
+
+    A pick depends on the latest earlier pick of every site in its closed neighbourhood
+    (the site and its four neighbours) and is put in the batch after the latest of them,
+    so doing the batches in order gives the same result as doing the picks one at a time
+    """
+    picks = len(rows)
+    sites = rows * dimensions + cols
+    offsets = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]
+    queries = np.concatenate([((rows + i) % dimensions) * dimensions + (cols + j) % dimensions for i, j in offsets])
+    # picks (writes) and neighbourhood sites (queries) sorted by site then position,
+    # a query at the same position as a write comes first so it only sees earlier picks
+    keys = np.concatenate([sites, queries])
+    positions = np.concatenate([np.arange(picks), np.tile(np.arange(picks), len(offsets))])
+    is_write = np.concatenate([np.ones(picks, dtype=bool), np.zeros(len(queries), dtype=bool)])
+    order = np.lexsort((is_write, positions, keys))
+    last_write = np.maximum.accumulate(np.where(is_write[order], np.arange(len(order)), -1))
+    is_query = ~is_write[order]
+    found = last_write[is_query]
+    valid = (found >= 0) & (keys[order][np.maximum(found, 0)] == keys[order][is_query])
+    latest = np.full(len(queries), -1)
+    latest[order[is_query] - picks] = np.where(valid, positions[order][np.maximum(found, 0)], -1)
+    latest = latest.reshape(len(offsets), picks)
+    # longest chain of dependencies leading to each pick
+    levels = np.zeros(picks, dtype=int)
+    while True:
+        new_levels = np.max(np.where(latest >= 0, levels[latest] + 1, 0), axis=0)
+        if np.array_equal(new_levels, levels):
+            break
+        levels = new_levels
+    order = np.argsort(levels, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(levels))[:-1])
+
+def sirs_batch_update(cells, rows, cols, random_numbers, probabilities):
+    """Applies the sirs rules to picked sites that do not depend on each other
+
+    cells can also be a stack of lattices with the probabilities and random numbers
+    broadcasting against the picks of every lattice. Returns the change in the number
+    of infected sites (of each lattice)
+    """
+    dimensions = cells.shape[-1]
+    states = cells[..., rows, cols]
+    infected_neighbour = (
+        (cells[..., (rows - 1) % dimensions, cols] == -1) | (cells[..., (rows + 1) % dimensions, cols] == -1) |
+        (cells[..., rows, (cols - 1) % dimensions] == -1) | (cells[..., rows, (cols + 1) % dimensions] == -1))
+    infect = (states == 0) & infected_neighbour & (random_numbers < probabilities[0])
+    recover = (states == -1) & (random_numbers < probabilities[1])
+    susceptible = (states == 1) & (random_numbers < probabilities[2])
+    states = np.where(infect, -1, np.where(recover, 1, np.where(susceptible, 0, states)))
+    cells[..., rows, cols] = states
+    return np.sum(infect, axis=-1) - np.sum(recover, axis=-1)
+
 # -----------------------------------------------------------------------------
+"""
+Cahn Hilliard Utility Functions
+---
+get_cahn_data: gets the free energy (and time) data back from a cahn hilliard data set
+periodic_laplacian: five point laplacian stencil sum of a field (periodic)
+create_radial_bins: radial wavenumber bins of an rfft2 grid
+structure_factor: circularly averaged structure factor of a field
+"""
 def get_cahn_data(file_data):
     timesteps = np.asarray([float(x.split(",")[0]) for x in file_data])
     energy = np.asarray([float(x.split(",")[1]) for x in file_data])
     data = [timesteps, energy]
+    if len(file_data) > 0 and len(file_data[0].split(",")) > 2:
+        # newer data sets also save the time each step reached
+        data.append(np.asarray([float(x.split(",")[2]) for x in file_data]))
 
     return data
+
+def periodic_laplacian(field, out):
+    """Sums the four nearest neighbours less four times each cell (periodic) into out
+
+    out is a preallocated buffer the same shape and type as the field
+    """
+    np.multiply(field, -4, out=out)
+    out[1:, :] += field[:-1, :]
+    out[:1, :] += field[-1:, :]
+    out[:-1, :] += field[1:, :]
+    out[-1:, :] += field[:1, :]
+    out[:, 1:] += field[:, :-1]
+    out[:, :1] += field[:, -1:]
+    out[:, :-1] += field[:, 1:]
+    out[:, -1:] += field[:, :1]
+    return out
+
+def create_radial_bins(dimensions):
+    """Bins every wavevector of an rfft2 of a square field by its rounded length
+
+    Returns the bin of each wavevector and its weight (the columns between the first
+    and last stand for themselves and their complex conjugates so count twice)
+    """
+    row_waves = np.fft.fftfreq(dimensions) * dimensions
+    col_waves = np.fft.rfftfreq(dimensions) * dimensions
+    radial_bins = np.rint(np.sqrt(row_waves[:, None] ** 2 + col_waves[None, :] ** 2)).astype(int)
+    weights = np.full(radial_bins.shape, 2.0)
+    weights[:, 0] = 1
+    if dimensions % 2 == 0:
+        weights[:, -1] = 1
+    # corners past the largest circle that fits are dropped
+    weights[radial_bins > dimensions // 2] = 0
+    return radial_bins, weights
+
+def structure_factor(field, radial_bins, weights):
+    """Circularly averages the structure factor of a field over the radial bins
+
+    Returns S for the bins 1 to the largest bin (the mean of the field is left out)
+    """
+    power = np.abs(np.fft.rfft2(field - np.mean(field))) ** 2 / field.size
+    totals = np.bincount(radial_bins.ravel(), weights=(weights * power).ravel())
+    counts = np.bincount(radial_bins.ravel(), weights=weights.ravel())
+    size = field.shape[0] // 2 + 1
+    return totals[1:size] / counts[1:size]